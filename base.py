@@ -24,12 +24,13 @@
 
 if "bpy" in locals():
     import imp
-    for x in [database_module, common, menu]:
+    for x in [database_module, common, menu, results]:
         imp.reload(x)
 else:
     from . import database_module
     from . import common
     from . import menu
+    from . import results
 from .database_module import Database, EntityLookupError
 from .common import FORMAT, safe_name, write_vector, write_orientation, Cube
 from .menu import method, nonlinear_solver, Tree
@@ -460,7 +461,7 @@ class BPY:
             return ret or self.float.check(context) or self.matrix.check(context)
     klasses = [InputCard, Constitutive, Definition, Drive, Driver, Element, Segment, Friction, Function, Matrix, Shape, Scene, Bool, Int, Float, Str, MatrixFloat]
     mbdyn_path = None
-    plot_data = dict()
+    plot_data = results.Cache()
     @classmethod
     def register(cls):
         cls.MatrixFloat.matrix = bpy.props.PointerProperty(type = cls.Matrix)
@@ -476,6 +477,8 @@ class BPY:
         bpy.types.Scene.hash = bpy.props.StringProperty()
         bpy.types.Scene.clean_log = bpy.props.BoolProperty(default=False)
         bpy.types.Scene.mbdyn_default_orientation = bpy.props.StringProperty()
+        bpy.types.Scene.mbdyn_netcdf = bpy.props.BoolProperty(default=False)
+        bpy.types.Scene.plot_cache_budget = bpy.props.IntProperty(name="Plot cache (MB)", min=16, default=1024, update=lambda self, context: cls.plot_data.resize(self.plot_cache_budget << 20))
         bpy.types.Scene.mbdyn_name = bpy.props.StringProperty()
         bpy.types.Scene.popups_enabled = bpy.props.BoolProperty(default=False)
         bpy.types.Object.mbdyn_name = bpy.props.StringProperty()
@@ -493,6 +496,8 @@ class BPY:
         del bpy.types.Scene.hash
         del bpy.types.Scene.clean_log
         del bpy.types.Scene.mbdyn_default_orientation
+        del bpy.types.Scene.mbdyn_netcdf
+        del bpy.types.Scene.plot_cache_budget
         del bpy.types.Scene.mbdyn_name
         del bpy.types.Scene.popups_enabled
         del bpy.types.Object.mbdyn_name
@@ -813,6 +818,7 @@ class Operators(list):
                         layout.operator(root_dot + "d_" + self.bl_idname[len(root_dot)+2:])
                     if self.module in "element".split():
                         layout.operator(root_dot + "plot_element")
+                        layout.operator(root_dot + "element_statistics")
             self.extend([Help, Create, Edit, Duplicate, Users, Unlink, Link, Menu])
     def register(self):
         for klass in self:
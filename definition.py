@@ -1141,6 +1141,8 @@ class AssemblyOperator(Base):
 klasses[AssemblyOperator.bl_label] = AssemblyOperator
 
 class JobControl(Entity):
+    netcdf = False
+    netcdf_only = False
     def write(self, f):
         if self.simulation_title is not None:
             f.write("\ttitle: " + self.simulation_title + ";\n")
@@ -1159,6 +1161,8 @@ class JobControl(Entity):
             else:
                 f.write("\tselect timeout: forever;\n")
         f.write("\tdefault orientation: " + self.default_orientation + ";\n")
+        if self.netcdf:
+            f.write("\toutput results: netcdf" + (", no text" if self.netcdf_only else "") + ";\n")
         f.write("\toutput meter: " + self.meter_drive.string() +
             ";\n\toutput precision: " + FORMAT(self.output_precision) + ";\n" +
             ("\tmodel: static;\n" if self.static_model else ""))
@@ -1182,6 +1186,8 @@ class JobControlOperator(Base):
         ], name="Default orientation", default="euler123")
     output_precision = bpy.props.IntProperty(name="Output precision", default=6, min=1)
     static_model = bpy.props.BoolProperty(name="Static model", description="Set model type to static")
+    netcdf = bpy.props.BoolProperty(name="NetCDF output", description="Also write the results to a binary NetCDF file, which keyframe import and plots then read")
+    netcdf_only = bpy.props.BoolProperty(name="No text output", description="Write the results only to the NetCDF file")
     def prereqs(self, context):
         self.meter_drive.type = "Meter drive"
         self.meter_drive.mandatory = True
@@ -1198,6 +1204,8 @@ class JobControlOperator(Base):
         self.default_orientation = self.entity.default_orientation
         self.output_precision = self.entity.output_precision
         self.static_model = self.entity.static_model
+        self.netcdf = self.entity.netcdf
+        self.netcdf_only = self.entity.netcdf_only
     def store(self, context):
         self.entity.simulation_title = self.simulation_title.store()
         self.entity.dof_stats = self.dof_stats
@@ -1211,6 +1219,8 @@ class JobControlOperator(Base):
         self.entity.default_orientation = self.default_orientation
         self.entity.output_precision = self.output_precision
         self.entity.static_model = self.static_model
+        self.entity.netcdf = self.netcdf
+        self.entity.netcdf_only = self.netcdf and self.netcdf_only
     def draw(self, context):
         layout = self.layout
         self.simulation_title.draw(layout, "Simulation title", "Set")
@@ -1227,6 +1237,10 @@ class JobControlOperator(Base):
         layout.prop(self, "default_orientation")
         layout.prop(self, "output_precision")
         layout.prop(self, "static_model")
+        row = layout.row()
+        row.prop(self, "netcdf")
+        if self.netcdf:
+            row.prop(self, "netcdf_only")
     def check(self, context):
         return True in [x.check(context) for x in [self.simulation_title, self.select_timeout, self.meter_drive]]
     def create_entity(self):
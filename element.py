@@ -23,22 +23,26 @@
 
 if "bpy" in locals():
     import imp
-    for x in [user_defined_element, common, base, menu]:
+    for x in [user_defined_element, common, base, menu, results]:
         imp.reload(x)
 else:
     from . import user_defined_element
     from . import common
     from . import base
     from . import menu
+    from . import results
 from .user_defined_element import klass_list
 from .common import (safe_name, Ellipsoid, RhombicPyramid, TriPyramid, Octahedron, Teardrop, Cylinder, Sphere, RectangularCuboid, write_vector, write_orientation)
 from .base import bpy, BPY, root_dot, database, Operator, Entity, Bundle, SelectedObjects, SegmentList
 from .menu import default_klasses, element_tree
 from mathutils import Vector
 from copy import copy
+from collections import OrderedDict
 import os
 import subprocess
-from tempfile import TemporaryFile
+from tempfile import mkdtemp
+import numpy as np
+import json
 
 class Base(Operator):
     bl_label = "Elements"
@@ -1074,42 +1078,80 @@ klasses[DrivenOperator.bl_label] = DrivenOperator
 class Plot:
     bl_options = {'REGISTER', 'INTERNAL'}
     label_names = bpy.props.CollectionProperty(type=BPY.Str)
+    mode = bpy.props.EnumProperty(items=[
+        ('time', "Time history", "Plot against simulation time"),
+        ('fft', "Spectrum (FFT)", "Amplitude spectrum of the whole run, Hann windowed"),
+        ('psd', "PSD (Welch)", "Power spectral density averaged over overlapping Hann windowed segments"),
+        ('spectrogram', "Spectrogram", "Power spectral density of each segment against time")],
+        name="Mode", default='time')
+    segment = bpy.props.IntProperty(name="Segment", description="Samples per segment", default=256, min=8)
+    overlap = bpy.props.FloatProperty(name="Overlap", description="Fraction of each segment shared with the next", default=.5, min=0., max=.95)
     def load(self, context, exts, pd):
         self.base = os.path.join(os.path.splitext(context.blend_data.filepath)[0], context.scene.name)
-        if 'frequency' not in BPY.plot_data:
-            with open(".".join((self.base, "log")), 'r') as f:
-                for line in f:
-                    if line.startswith("output frequency:"):
-                        BPY.plot_data['frequency'] = int(line.split()[-1])
-                        break
-        if 'out' not in BPY.plot_data:
-            BPY.plot_data['out'] = pd.read_table(".".join((self.base, 'out')), sep=" ", skiprows=2, usecols=[i for i in range(2, 9)])
-            BPY.plot_data['timeseries'] = BPY.plot_data['out']['Time'][::BPY.plot_data['frequency']]
-        for ext in exts:
-            if ext not in BPY.plot_data:
-                df = pd.read_csv(".".join((self.base, ext)), sep=" ", header=None, skipinitialspace=True, names=[i for i in range(1000)], lineterminator="\n")
-                value_counts = df[0].value_counts()
-                p = dict()
-                for node_label in df[0].unique():
-                    p[str(int(node_label))] = df.ix[df[0]==node_label, 1:].dropna(1, 'all')
-                    p[str(int(node_label))].index = [i for i in range(value_counts[node_label])]
-                BPY.plot_data[ext] = pd.Panel(p)
+        BPY.plot_data.resize(context.scene.plot_cache_budget << 20)
+        if context.scene.mbdyn_netcdf:
+            nc_file = ".".join((self.base, "nc"))
+            netcdf = BPY.plot_data.get("nc", nc_file, lambda: results.NetCDF(nc_file))
+            self.timeseries = BPY.plot_data.get("timeseries", nc_file, lambda: pd.Series(netcdf.times))
+            self.sources = dict((ext, nc_file) for ext in exts)
+            self.stores = dict((ext, BPY.plot_data.get(ext, nc_file, lambda: results.NetCDFStore(netcdf, ext))) for ext in exts)
+        else:
+            log_file, out_file = ".".join((self.base, "log")), ".".join((self.base, "out"))
+            frequency = BPY.plot_data.get("log", log_file, lambda: results.log_metadata(log_file))["frequency"]
+            out = BPY.plot_data.get("out", out_file, lambda: results.read_out(out_file))
+            self.timeseries = BPY.plot_data.get(("timeseries", frequency), out_file, lambda: pd.Series(out[1][::frequency]))
+            self.sources = dict((ext, ".".join((self.base, ext))) for ext in exts)
+            self.stores = dict((ext, BPY.plot_data.get(ext, self.sources[ext], lambda: results.label_store(self.sources[ext]))) for ext in exts)
+    def frame(self, ext, label, pd):
+        values = BPY.plot_data.get((ext, label), self.sources[ext], lambda: self.stores[ext][label])
+        return pd.DataFrame(values, columns=[j for j in range(1, values.shape[1] + 1)])
+    def handoff(self, header, *blocks):
+        directory = mkdtemp(prefix="mbdyn_plot_")
+        data = np.lib.format.open_memmap(os.path.join(directory, "data.npy"), mode='w+', dtype=np.float64, shape=blocks[0].shape[:-1] + (sum(block.shape[-1] for block in blocks),))
+        column = 0
+        for block in blocks:
+            data[..., column : column + block.shape[-1]] = block
+            column += block.shape[-1]
+        data.flush()
+        del data
+        header.update(name=self.entity.name, data="data.npy")
+        with open(os.path.join(directory, "header.json"), 'w') as f:
+            json.dump(header, f)
+        plot_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plot.py")
+        subprocess.Popen(("python3", plot_script, os.path.join(directory, "header.json")))
     def execute(self, context):
         select = [name.select for name in self.label_names]
         if True in select:
-            dataframe = self.dataframe.T[select].T.rename(BPY.plot_data['timeseries'])
-            dataframe.columns = [name.value for name in self.label_names if name.select]
-            plot_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plot.py")
-            with TemporaryFile('w') as f:
-                f.write(self.entity.name + "\n")
-                dataframe.to_csv(f)
-                f.seek(0)
-                subprocess.Popen(("python3", plot_script), stdin=f)
+            values = self.dataframe.values
+            n = min(len(values), len(self.timeseries))
+            times, values = self.timeseries.values[:n], values[:n, np.array(select)]
+            columns = [name.value for name in self.label_names if name.select]
+            if self.mode == 'time':
+                self.handoff({"columns": columns}, times[:, None], values)
+            elif n < 2:
+                self.report({'ERROR'}, "Too few samples for a spectrum.")
+            else:
+                fs, values = results.uniform(times, values)
+                if self.mode == 'fft':
+                    frequencies, amplitude = results.spectrum(values, fs)
+                    self.handoff({"columns": columns, "xlabel": "Frequency (Hz)", "ylabel": "Amplitude"}, frequencies[:, None], amplitude)
+                elif self.mode == 'psd':
+                    frequencies, power = results.welch(values, fs, self.segment, self.overlap)
+                    self.handoff({"columns": columns, "xlabel": "Frequency (Hz)", "ylabel": "Power spectral density (per Hz)", "yscale": "log"}, frequencies[:, None], power)
+                else:
+                    frequencies, centers, power = results.spectrogram(values, fs, self.segment, self.overlap)
+                    self.handoff({"columns": columns, "kind": "spectrogram",
+                        "extent": [float(times[0] + centers[0]), float(times[0] + centers[-1]), float(frequencies[0]), float(frequencies[-1])]}, power)
         elif self.label_names:
             self.report({'ERROR'}, "None selected.")
         return{'FINISHED'}
     def draw(self, context):
         layout = self.layout
+        layout.prop(self, "mode")
+        if self.mode in ('psd', 'spectrogram'):
+            row = layout.row()
+            row.prop(self, "segment")
+            row.prop(self, "overlap")
         for name in self.label_names:
             row = layout.row()
             row.prop(name, "select", text="")
@@ -1127,8 +1169,8 @@ class PlotElement(bpy.types.Operator, Plot):
         import pandas as pd
         self.load(context, [self.entity.file_ext], pd)
         self.label_names.clear()
-        key = "1" if self.entity.file_ext == "grv" else str(sorted(database.element, key=lambda x: x.name).index(self.entity))    
-        self.dataframe = BPY.plot_data[self.entity.file_ext][key].dropna(1, 'all')
+        key = 1 if self.entity.file_ext == "grv" else sorted(database.element, key=lambda x: x.name).index(self.entity)
+        self.dataframe = self.frame(self.entity.file_ext, key, pd)
         for i in range(self.dataframe.shape[1]):
             name = self.label_names.add()
             name.value = self.entity.labels[i] if i < len(self.entity.labels) else str(i + 2)
@@ -1148,18 +1190,12 @@ class PlotNode(bpy.types.Operator, Plot):
         self.entity = SelectedObjects(context)[0]
         import pandas as pd
         self.load(context, "ine mov".split(), pd)
-        node_label = str(database.node.index(SelectedObjects(context)[0]))
-        self.dataframe = BPY.plot_data['mov'][node_label].dropna(1, 'all')
-        columns = "X Y Z".split() + {
-            "orientation matrix": ["R" + str(1 + int(i/3)) + str(1 + int(i%3)) for i in range(9)],
-            "orientation vector": "v1 v2 v3".split(),
-            "euler123": "e1 e2 e3".split(),
-            "euler321": "e3 e2 e1".split(),
-            "euler313": "e3 e1 e3".split()}[context.scene.mbdyn_default_orientation]
-        self.dataframe.columns = columns + ["u v w omega-1 omega-2 omega-3 u_dot v_dot w_dot omega-1_dot omega-2_dot omega-3_dot".split()[i] for i in range(self.dataframe.shape[1] - len(columns))]
-        if node_label in BPY.plot_data['ine']:
-            df = BPY.plot_data['ine'][node_label].dropna(1, 'all')
-            df.columns = "px py pz Lx Ly Lz dpx/dt dpy/dt dpz/dt dLx/dt dLy/dt dLz/dt".split()
+        node_label = database.node.index(SelectedObjects(context)[0])
+        self.dataframe = self.frame('mov', node_label, pd)
+        self.dataframe.columns = results.node_fields(context.scene.mbdyn_default_orientation)[:self.dataframe.shape[1]]
+        if node_label in self.stores['ine']:
+            df = self.frame('ine', node_label, pd)
+            df.columns = results.INE_FIELDS
             self.dataframe = self.dataframe.join(df)
         self.label_names.clear()
         for label in self.dataframe.columns:
@@ -1169,6 +1205,85 @@ class PlotNode(bpy.types.Operator, Plot):
         return context.window_manager.invoke_props_dialog(self)
 BPY.klasses.append(PlotNode)
 
+class OutputStatistics(bpy.types.Operator):
+    bl_label = "Output statistics"
+    bl_description = "Compute the min, max, mean, RMS and time of peak of every output channel in one streaming pass"
+    bl_idname = root_dot + "output_statistics"
+    bl_options = {'REGISTER', 'INTERNAL'}
+    @classmethod
+    def poll(cls, context):
+        return context.scene.clean_log
+    def execute(self, context):
+        base = os.path.join(os.path.splitext(context.blend_data.filepath)[0], context.scene.name)
+        orientation = context.scene.mbdyn_default_orientation
+        netcdf = results.NetCDF(".".join((base, "nc"))) if context.scene.mbdyn_netcdf else None
+        if not netcdf:
+            times = results.read_out(".".join((base, "out")))[1][::results.output_frequency(".".join((base, "log")))]
+        elements = sorted(database.element, key=lambda x: x.name)
+        for element in elements:
+            element.statistics = OrderedDict()
+        wm = context.window_manager
+        wm.progress_begin(0., float(len(results.OUTPUT_EXTS)))
+        for i, ext in enumerate(results.OUTPUT_EXTS):
+            source = ".".join((base, ext))
+            if netcdf and netcdf.labels(ext):
+                labels, summary = results.netcdf_statistics(netcdf, ext)
+            elif not netcdf and os.path.exists(source):
+                labels, summary = results.statistics(source, times, lambda fraction: wm.progress_update(i + fraction))
+            else:
+                continue
+            for j, label in enumerate(labels):
+                if ext in ("mov", "ine"):
+                    if label < len(database.node):
+                        node = database.node[label]
+                        table = node.get("mbdyn_statistics", dict()) if ext == "ine" else dict()
+                        fields = results.node_fields(orientation) if ext == "mov" else results.INE_FIELDS
+                        for k, name in enumerate(fields[:summary["mean"].shape[1]]):
+                            if not np.isnan(summary["mean"][j, k]):
+                                table[name] = [float(summary[key][j, k]) for key in results.STATISTICS]
+                        node["mbdyn_statistics"] = table
+                    continue
+                if ext == "grv":
+                    element = next((e for e in elements if getattr(e, "file_ext", None) == "grv"), None)
+                else:
+                    element = elements[label] if label < len(elements) else None
+                if element is None or getattr(element, "file_ext", None) != ext:
+                    continue
+                for k in range(summary["mean"].shape[1]):
+                    if not np.isnan(summary["mean"][j, k]):
+                        element.statistics[element.labels[k] if k < len(element.labels) else str(k + 2)] = [float(summary[key][j, k]) for key in results.STATISTICS]
+        wm.progress_end()
+        self.report({'INFO'}, "Statistics of " + str(len([e for e in elements if e.statistics])) + " elements and " + str(len(database.node)) + " nodes")
+        return{'FINISHED'}
+BPY.klasses.append(OutputStatistics)
+
+class ElementStatistics(bpy.types.Operator):
+    bl_label = "Statistics"
+    bl_description = "Show the output statistics of the selected element"
+    bl_idname = root_dot + "element_statistics"
+    bl_options = {'REGISTER', 'INTERNAL'}
+    @classmethod
+    def poll(cls, context):
+        return (context.scene.clean_log and 0 <= context.scene.element_index < len(database.element)
+            and getattr(database.element[context.scene.element_index], "statistics", None))
+    def invoke(self, context, event):
+        self.entity = database.element[context.scene.element_index]
+        return context.window_manager.invoke_popup(self, width=600)
+    def draw(self, context):
+        layout = self.layout
+        layout.label(self.entity.name)
+        row = layout.row()
+        for heading in ["", "Min", "Max", "Mean", "RMS", "Time of peak"]:
+            row.label(heading)
+        for name, values in self.entity.statistics.items():
+            row = layout.row()
+            row.label(name)
+            for value in values:
+                row.label(BPY.FORMAT(value))
+    def execute(self, context):
+        return{'FINISHED'}
+BPY.klasses.append(ElementStatistics)
+
 class DuplicateFromObjects(bpy.types.Operator):
     bl_label = "Duplicate"
     bl_description = "Duplicate the selected objects along with some or all of the entities using them"
@@ -23,13 +23,49 @@
 # -------------------------------------------------------------------------- 
 
 import matplotlib.pyplot as plt
-import pandas as pd
+import numpy as np
+import json
+import os
+import shutil
 import sys
+import results
 
-with sys.stdin as f:
-    name = f.readline().strip()
-    pd.read_csv(f, index_col=0).plot()
-    plt.gcf().canvas.set_window_title(name)
-plt.xlabel("Time (in seconds)")
+directory = os.path.dirname(os.path.abspath(sys.argv[1]))
+with open(sys.argv[1]) as f:
+    header = json.load(f)
+name = header["name"]
+data = np.load(os.path.join(directory, header["data"]), mmap_mode='r')
+if header.get("kind") == "spectrogram":
+    for i, column in enumerate(header["columns"]):
+        ax = plt.subplot(len(header["columns"]), 1, i + 1)
+        image = ax.imshow(10. * np.log10(np.maximum(data[:, i], np.finfo(float).tiny)), extent=header["extent"], origin='lower', aspect='auto')
+        plt.colorbar(image, ax=ax, label="dB per Hz")
+        ax.set_title(column)
+        ax.set_ylabel("Frequency (Hz)")
+else:
+    x = data[:, 0]
+    ax = plt.gca()
+    lines = [ax.plot([], [])[0] for column in header["columns"]]
+    def downsample(ax):
+        start, stop = np.searchsorted(x, ax.get_xlim())
+        start, stop = max(start - 1, 0), min(stop + 1, len(x))
+        buckets = max(int(ax.bbox.width), 1)
+        for i, line in enumerate(lines):
+            keep = start + results.min_max(data[start:stop, i + 1], buckets)
+            line.set_data(x[keep], data[keep, i + 1])
+        ax.figure.canvas.draw_idle()
+    ax.set_yscale(header.get("yscale", "linear"))
+    if len(x):
+        ax.set_xlim(x[0], x[-1])
+        downsample(ax)
+        ax.relim()
+        ax.autoscale_view(scalex=False)
+    ax.callbacks.connect('xlim_changed', downsample)
+    plt.legend(header["columns"])
+    if "ylabel" in header:
+        plt.ylabel(header["ylabel"])
+plt.gcf().canvas.set_window_title(name)
+plt.xlabel(header.get("xlabel", "Time (in seconds)"))
 plt.show()
-
+del data
+shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,930 @@
+# --------------------------------------------------------------------------
+# BlenderAndMBDyn
+# Copyright (C) 2015 G. Douglas Baldwin - http://www.baldwintechnology.com
+# --------------------------------------------------------------------------
+# ***** BEGIN GPL LICENSE BLOCK *****
+#
+#    This file is part of BlenderAndMBDyn.
+#
+#    BlenderAndMBDyn is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    BlenderAndMBDyn is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with BlenderAndMBDyn.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ***** END GPL LICENCE BLOCK *****
+# -------------------------------------------------------------------------- 
+
+import numpy as np
+import json
+import os
+import zipfile
+import hashlib
+import re
+import shutil
+from collections import OrderedDict
+from itertools import product
+from tempfile import mkdtemp
+
+CHUNK_SIZE = 1 << 26
+OUT_CHUNK = 1 << 16
+
+NETCDF_GROUPS = {
+    "mov": "node.struct",
+    "ine": "node.struct",
+    "jnt": "elem.joint",
+    "frc": "elem.force",
+    "act": "elem.beam",
+    "aer": "elem.aerodynamic",
+    "rot": "elem.rotor",
+    "usr": "elem.loadable"}
+NETCDF_FIELDS = {
+    "mov": ["X", ("R", "Phi", "E"), "XP", "Omega", "XPP", "OmegaP"],
+    "ine": ["B", "G", "BP", "GP"]}
+
+OUTPUT_EXTS = "mov ine jnt frc act aer usr grv".split()
+ORIENTATION_FIELDS = {
+    "orientation matrix": ["R" + str(1 + int(i/3)) + str(1 + int(i%3)) for i in range(9)],
+    "orientation vector": "v1 v2 v3".split(),
+    "euler123": "e1 e2 e3".split(),
+    "euler321": "e3 e2 e1".split(),
+    "euler313": "e3 e1 e3".split()}
+MOV_FIELDS = "u v w omega-1 omega-2 omega-3 u_dot v_dot w_dot omega-1_dot omega-2_dot omega-3_dot".split()
+INE_FIELDS = "px py pz Lx Ly Lz dpx/dt dpy/dt dpz/dt dLx/dt dLy/dt dLz/dt".split()
+
+RESULT_EXTS = ["out", "log", "nc"] + OUTPUT_EXTS
+LOG_ELEMENTS = set("body beam2 beam3 clamp distance inline inplane rod totaljoint totalpinjoint viscousbody axialrotation revolutehinge sphericalhinge deformablehinge deformablejoint deformabledisplacementjoint structuralforce structuralcouple".split())
+
+def node_fields(orientation):
+    return "X Y Z".split() + ORIENTATION_FIELDS[orientation] + MOV_FIELDS
+
+class Cancelled(Exception):
+    pass
+
+def parse_log(source):
+    metadata = {"frequency": 1, "nodes": dict(), "elements": dict(), "assembly": list(), "eigenanalysis": list()}
+    with open(source, 'r', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            name, colon, rest = line.partition(":")
+            fields = rest.split()
+            lower = line.lower()
+            if name == "output frequency" and fields:
+                metadata["frequency"] = int(fields[-1])
+            elif "assembly" in lower:
+                metadata["assembly"].append(line)
+            elif "eigen" in lower:
+                metadata["eigenanalysis"].append(line)
+            elif colon and fields and fields[0].isdigit():
+                if name.endswith(" node"):
+                    metadata["nodes"].setdefault(fields[0], name)
+                elif name.replace(" ", "").lower() in LOG_ELEMENTS:
+                    metadata["elements"].setdefault(fields[0], name)
+    return metadata
+
+def log_metadata(log_file):
+    try:
+        with open(log_file + ".meta.json", 'r') as f:
+            metadata = json.load(f)
+        if metadata.get("stamp") == stamp(log_file):
+            return metadata
+    except (OSError, ValueError):
+        pass
+    log_stamp = stamp(log_file)
+    metadata = parse_log(log_file)
+    metadata["stamp"] = log_stamp
+    try:
+        with open(log_file + ".meta.json.tmp", 'w') as f:
+            json.dump(metadata, f)
+        os.replace(log_file + ".meta.json.tmp", log_file + ".meta.json")
+    except OSError:
+        pass
+    return metadata
+
+def parse_solver(lines):
+    solver = dict()
+    for line in lines:
+        name, colon, rest = line.strip().partition(":")
+        fields = rest.split()
+        lower = line.lower()
+        if lower.startswith("end of simulation"):
+            words = lower.replace(";", " ").split()
+            if "time" in words and "after" in words:
+                solver["final time"] = float(words[words.index("time") + 1])
+                solver["steps"] = int(words[words.index("after") + 1])
+        elif name.startswith("total ") and len(fields) == 1:
+            try:
+                solver[name[len("total "):]] = float(fields[0])
+            except ValueError:
+                pass
+    return solver
+
+def output_frequency(log_file):
+    try:
+        return log_metadata(log_file)["frequency"]
+    except OSError:
+        return 1
+
+def keyframe_mask(times, dt, keytime=- float("inf")):
+    mask = np.zeros(len(times), dtype=bool)
+    for i, time in enumerate(times):
+        if dt < time - keytime:
+            keytime = time
+            mask[i] = True
+    return mask
+
+def simplify(x, y, tolerance):
+    keep = np.zeros(len(y), dtype=bool)
+    if len(y) < 3 or tolerance <= 0.:
+        keep[:] = True
+        return keep
+    keep[0] = keep[-1] = True
+    stack = [(0, len(y) - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        line = y[i] + (y[j] - y[i]) * (x[i+1:j] - x[i]) / (x[j] - x[i])
+        error = np.abs(y[i+1:j] - line)
+        k = int(np.argmax(error))
+        if tolerance < error[k]:
+            k += i + 1
+            keep[k] = True
+            stack.extend([(i, k), (k, j)])
+    return keep
+
+def min_max(y, buckets):
+    n = len(y)
+    if n <= 2 * buckets:
+        return np.arange(n)
+    size = -(-n // buckets)
+    blocks = np.concatenate((y, np.repeat(y[-1:], buckets * size - n))).reshape(buckets, size)
+    base = np.arange(buckets) * size
+    keep = np.concatenate(([0, n - 1], base + blocks.argmin(axis=1), base + blocks.argmax(axis=1)))
+    return np.unique(np.minimum(keep, n - 1))
+
+def uniform(times, values):
+    steps = np.diff(times)
+    dt = float(np.median(steps)) if len(steps) else 1.
+    if np.allclose(steps, dt):
+        return 1. / dt, values
+    grid = np.arange(times[0], times[-1] + .5 * dt, dt)
+    return 1. / dt, np.column_stack([np.interp(grid, times, values[:, k]) for k in range(values.shape[1])])
+
+def segments(values, size, overlap=.5):
+    size = max(1, min(size, len(values)))
+    starts = np.arange(0, len(values) - size + 1, max(1, int(size * (1. - overlap))))
+    frames = values[starts[:, None] + np.arange(size)]
+    return starts, frames - frames.mean(axis=1, keepdims=True)
+
+def hann(size):
+    return .5 - .5 * np.cos(2. * np.pi * np.arange(size) / size) if 1 < size else np.ones(size)
+
+def spectrum(values, fs):
+    window = hann(len(values))
+    amplitude = np.abs(np.fft.rfft((values - values.mean(axis=0)) * window[:, None], axis=0)) * 2. / window.sum()
+    amplitude[0] /= 2.
+    return np.fft.rfftfreq(len(values), 1. / fs), amplitude
+
+def periodograms(values, fs, size, overlap=.5):
+    starts, frames = segments(values, size, overlap)
+    size = frames.shape[1]
+    window = hann(size)
+    power = np.abs(np.fft.rfft(frames * window[None, :, None], axis=1)) ** 2 / (fs * (window * window).sum())
+    power[:, 1:None if size % 2 else -1] *= 2.
+    return np.fft.rfftfreq(size, 1. / fs), starts + size / 2., power
+
+def welch(values, fs, size=256, overlap=.5):
+    frequencies, centers, power = periodograms(values, fs, size, overlap)
+    return frequencies, power.mean(axis=0)
+
+def spectrogram(values, fs, size=256, overlap=.5):
+    frequencies, centers, power = periodograms(values, fs, size, overlap)
+    return frequencies, centers / fs, np.moveaxis(power, 0, -1)
+
+def stamp(source):
+    st = os.stat(source)
+    return [st.st_size, st.st_mtime]
+
+def load_sidecar(source, name=""):
+    try:
+        with open(source + name + ".json", 'r') as f:
+            header = json.load(f)
+    except (OSError, ValueError):
+        return None, None
+    if header.get("stamp") != stamp(source):
+        return None, None
+    shape = tuple(header["shape"])
+    if not all(shape):
+        return header, np.empty(shape)
+    try:
+        return header, np.memmap(source + name + ".f8", dtype=np.float64, mode='r', shape=shape)
+    except (OSError, ValueError):
+        return None, None
+
+def cached(source, parse, progress=None, name=""):
+    header, data = load_sidecar(source, name)
+    if data is not None:
+        if progress:
+            progress(1.)
+        return header, data
+    header = {"stamp": stamp(source)}
+    try:
+        if os.path.exists(source + name + ".json"):
+            os.remove(source + name + ".json")
+        with open(source + name + ".f8", 'wb') as f:
+            for block in parse(source, header, progress):
+                block.tofile(f)
+                header["shape"][0] += len(block)
+        with open(source + name + ".json.tmp", 'w') as f:
+            json.dump(header, f)
+        os.replace(source + name + ".json.tmp", source + name + ".json")
+    except OSError:
+        header = {"stamp": stamp(source)}
+        blocks = list(parse(source, header, progress))
+        return header, np.concatenate(blocks) if blocks else np.empty(header["shape"])
+    shape = tuple(header["shape"])
+    return header, np.memmap(source + name + ".f8", dtype=np.float64, mode='r', shape=shape) if all(shape) else np.empty(shape)
+
+def nbytes(value):
+    if isinstance(value, (tuple, list)):
+        return sum(nbytes(x) for x in value)
+    size = getattr(value, "nbytes", 0)
+    return int(size() if callable(size) else size)
+
+class Cache:
+    def __init__(self, budget=1 << 30):
+        self.entries = OrderedDict()
+        self.budget, self.size = budget, 0
+        self.hits, self.misses, self.evictions = 0, 0, 0
+    def __len__(self):
+        return len(self.entries)
+    def get(self, key, source, load):
+        current = stamp(source) if os.path.exists(source) else None
+        if key in self.entries:
+            value, size, entry_stamp = self.entries[key]
+            if entry_stamp == current:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self.discard(key)
+        self.misses += 1
+        value = load()
+        size = nbytes(value)
+        self.entries[key] = (value, size, current)
+        self.size += size
+        self.evict()
+        return value
+    def discard(self, key):
+        value, size, entry_stamp = self.entries.pop(key)
+        self.size -= size
+    def evict(self):
+        while self.size > self.budget and 1 < len(self.entries):
+            self.discard(next(iter(self.entries)))
+            self.evictions += 1
+    def resize(self, budget):
+        self.budget = budget
+        self.evict()
+    def clear(self):
+        for value, size, entry_stamp in self.entries.values():
+            if hasattr(value, "close"):
+                value.close()
+        self.entries.clear()
+        self.size = 0
+
+def chunks(f, chunk_size=CHUNK_SIZE):
+    tail = b""
+    buf = f.read(chunk_size)
+    while buf:
+        buf = tail + buf
+        end = buf.rfind(b"\n") + 1
+        tail = buf[end:]
+        if end:
+            yield buf[:end]
+        buf = f.read(chunk_size)
+    if tail.strip():
+        yield tail
+
+def scan_layout(lines):
+    labels, widths, seen = list(), list(), set()
+    for line in lines:
+        fields = line.split()
+        if not fields:
+            continue
+        label = int(float(fields[0]))
+        if label in seen:
+            return labels, widths, True
+        seen.add(label)
+        labels.append(label)
+        widths.append(len(fields))
+    return labels, widths, False
+
+def step_layout(f):
+    labels, widths, complete = scan_layout(f)
+    f.seek(0)
+    return labels, widths
+
+class StepLayout:
+    def __init__(self, labels, widths):
+        self.labels, self.widths = labels, widths
+        self.step_size = sum(widths)
+        self.n_fields = max(widths) - 1 if widths else 0
+        self.mask = np.zeros((len(labels), self.n_fields), dtype=bool)
+        for i, width in enumerate(widths):
+            self.mask[i, :width-1] = True
+        self.columns = np.ones(self.step_size, dtype=bool)
+        self.columns[np.cumsum([0] + widths[:-1], dtype=int)] = False
+    def unpack(self, values):
+        n = len(values) // self.step_size
+        block = np.full((n, len(self.labels), self.n_fields), np.nan)
+        block[:, self.mask] = values[:n*self.step_size].reshape(n, self.step_size)[:, self.columns]
+        return block, values[n*self.step_size:]
+
+def parse_steps(source, header, progress=None, chunk_size=CHUNK_SIZE):
+    with open(source, 'rb') as f:
+        size = f.seek(0, 2)
+        f.seek(0)
+        layout = StepLayout(*step_layout(f))
+        header["labels"], header["widths"] = layout.labels, layout.widths
+        header["shape"] = [0, len(layout.labels), layout.n_fields]
+        leftover, pos = np.empty(0), 0
+        for buf in chunks(f, chunk_size) if layout.step_size else ():
+            pos += len(buf)
+            block, leftover = layout.unpack(np.concatenate((leftover, np.fromstring(buf, sep=" "))))
+            yield block
+            if progress:
+                progress(float(pos) / float(size))
+
+def parse_step_index(source, header, progress=None, chunk_size=CHUNK_SIZE):
+    with open(source, 'rb') as f:
+        size = f.seek(0, 2)
+        f.seek(0)
+        labels, widths = step_layout(f)
+        n = len(labels)
+        header["labels"], header["widths"] = labels, widths
+        header["shape"] = [0, 1]
+        header["end"] = 0
+        lines, pos, pending = 0, 0, np.empty((0, 2), dtype=np.int64)
+        for buf in chunks(f, chunk_size) if n else ():
+            newlines = np.flatnonzero(np.frombuffer(buf, dtype=np.uint8) == 10)
+            if not len(newlines):
+                break
+            starts = np.concatenate(([0], newlines[:-1] + 1)) + pos
+            first = (-lines) % n
+            numbers = lines + first + n*np.arange(len(starts[first::n]), dtype=np.int64)
+            pending = np.concatenate((pending, np.column_stack((numbers, starts[first::n]))))
+            lines += len(newlines)
+            pos += newlines[-1] + 1
+            complete = pending[:, 0] + n <= lines
+            yield pending[complete, 1:].astype(np.float64)
+            pending = pending[~complete]
+            header["end"] = int(pending[0, 1]) if len(pending) else int(pos)
+            if progress:
+                progress(float(pos) / float(size))
+
+def parse_line_index(source, header, progress=None, chunk_size=CHUNK_SIZE):
+    with open(source, 'rb') as f:
+        size = f.seek(0, 2)
+        f.seek(0)
+        labels, widths = step_layout(f)
+        n = len(labels)
+        header["labels"], header["widths"] = labels, widths
+        header["shape"] = [0, n]
+        header["end"] = 0
+        pos, pending = 0, np.empty(0, dtype=np.int64)
+        for buf in chunks(f, chunk_size) if n else ():
+            newlines = np.flatnonzero(np.frombuffer(buf, dtype=np.uint8) == 10)
+            if not len(newlines):
+                break
+            pending = np.concatenate((pending, np.concatenate(([0], newlines[:-1] + 1)) + pos))
+            pos += newlines[-1] + 1
+            complete = len(pending) - len(pending) % n
+            yield pending[:complete].reshape(-1, n).astype(np.float64)
+            pending = pending[complete:]
+            header["end"] = int(pending[0]) if len(pending) else int(pos)
+            if progress:
+                progress(float(pos) / float(size))
+
+def parse_out(source, header, progress=None):
+    header["shape"] = [0, 0]
+    with open(source, 'rb') as f:
+        size = f.seek(0, 2)
+        f.seek(0)
+        rows = list()
+        for line in f:
+            if line.startswith(b"Step"):
+                rows.append(line.split()[1:])
+            elif line.startswith(b"# Step") and "columns" not in header:
+                header["columns"] = line.decode().split()[1:]
+            if len(rows) == OUT_CHUNK:
+                yield out_block(rows, header)
+                rows = list()
+                if progress:
+                    progress(float(f.tell()) / float(size))
+        if rows:
+            yield out_block(rows, header)
+    if progress:
+        progress(1.)
+
+def parse_out_index(source, header, progress=None):
+    header["shape"] = [0, 3]
+    with open(source, 'rb') as f:
+        rows, pos = list(), 0
+        for line in f:
+            if line.startswith(b"Step") and line.endswith(b"\n"):
+                fields = line.split()
+                rows.append((float(fields[1]), float(fields[2]), pos))
+                if len(rows) == OUT_CHUNK:
+                    yield np.array(rows)
+                    rows = list()
+            pos += len(line)
+        if rows:
+            yield np.array(rows)
+
+def out_block(rows, header):
+    if not header["shape"][1]:
+        header["shape"][1] = len(rows[0])
+    width = header["shape"][1]
+    block = np.full((len(rows), width), np.nan)
+    for i, row in enumerate(rows):
+        block[i, :len(row)] = [float(x) for x in row[:width]]
+    return block
+
+def read_steps(source, select=None, progress=None):
+    header, data = cached(source, parse_steps, progress)
+    if select is not None:
+        keep = np.zeros(len(data), dtype=bool)
+        keep[:len(select)] = select[:len(data)]
+        data = data[keep]
+    return header["labels"], data
+
+def parse_columns(source, header, progress=None):
+    steps, data = cached(source, parse_steps)
+    if "widths" in steps:
+        widths = steps["widths"]
+    else:
+        widths = [1 + int(n) for n in (~np.isnan(data[0])).sum(axis=1)] if len(data) else [1] * len(steps["labels"])
+    header["labels"], header["widths"], header["shape"], header["table"] = steps["labels"], widths, [0], list()
+    offset = 0
+    for i, width in enumerate(widths):
+        header["table"].append([offset, len(data), width - 1])
+        offset += len(data) * (width - 1)
+        yield np.ascontiguousarray(data[:, i, :width - 1]).ravel()
+        if progress:
+            progress(float(i + 1) / float(len(widths)))
+
+def label_store(source):
+    header, values = load_sidecar(source, ".cols")
+    return LabelStore(source) if values is not None else LabelIndex(source)
+
+def read_out(out_file):
+    header, data = cached(out_file, parse_out)
+    if not data.shape[1]:
+        return np.empty(0, dtype=int), np.empty(0)
+    return data[:, 0].astype(int), data[:, 1]
+
+def write_columns(path, data, chunk_size=CHUNK_SIZE):
+    columns = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=data.shape[1:] + data.shape[:1])
+    step = max(1, chunk_size // max(1, 8 * int(np.prod(data.shape[1:]))))
+    for start in range(0, len(data), step):
+        columns[..., start : start + step] = np.moveaxis(np.asarray(data[start : start + step]), 0, -1)
+    columns.flush()
+    del columns
+
+def export(base, archive, manifest, netcdf=None, progress=None):
+    directory = mkdtemp(prefix="mbdyn_export_")
+    sources = [ext for ext in OUTPUT_EXTS if os.path.exists(".".join((base, ext))) or netcdf and netcdf.labels(ext)]
+    names = dict((ext, manifest.pop(ext, dict())) for ext in OUTPUT_EXTS)
+    try:
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+            if netcdf:
+                times, columns = netcdf.times[:, None], ["Time"]
+            else:
+                header, times = cached(".".join((base, "out")), parse_out)
+                columns = header.get("columns", list())[:times.shape[1]]
+            write_columns(os.path.join(directory, "out.npy"), times)
+            zf.write(os.path.join(directory, "out.npy"), "out.npy")
+            manifest["out"] = {"data": "out.npy", "layout": ["column", "step"], "columns": columns}
+            for i, ext in enumerate(sources):
+                if os.path.exists(".".join((base, ext))):
+                    header, data = cached(".".join((base, ext)), parse_steps)
+                    labels = header["labels"]
+                else:
+                    labels, data = netcdf.read(ext)
+                write_columns(os.path.join(directory, ext + ".npy"), data)
+                zf.write(os.path.join(directory, ext + ".npy"), ext + ".npy")
+                os.remove(os.path.join(directory, ext + ".npy"))
+                manifest[ext] = {"data": ext + ".npy", "layout": ["label", "field", "step"],
+                    "labels": [dict(names[ext].get(label, dict()), label=label) for label in labels]}
+                if progress:
+                    progress(float(i + 1) / float(len(sources)))
+            zf.writestr("manifest.json", json.dumps(manifest, indent=1))
+    finally:
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+STATISTICS = "min max mean rms peak_time".split()
+
+class Statistics:
+    def __init__(self, shape):
+        self.count = np.zeros(shape)
+        self.minimum, self.maximum = np.full(shape, np.inf), np.full(shape, -np.inf)
+        self.total, self.squares = np.zeros(shape), np.zeros(shape)
+        self.peak, self.peak_time = np.full(shape, -np.inf), np.full(shape, np.nan)
+    def update(self, block, times):
+        valid = ~np.isnan(block)
+        values = np.where(valid, block, 0.)
+        self.count += valid.sum(axis=0)
+        self.minimum = np.fmin(self.minimum, np.where(valid, block, np.inf).min(axis=0))
+        self.maximum = np.fmax(self.maximum, np.where(valid, block, -np.inf).max(axis=0))
+        self.total += values.sum(axis=0)
+        self.squares += (values * values).sum(axis=0)
+        magnitude = np.where(valid, np.abs(block), -np.inf)
+        k = magnitude.argmax(axis=0)
+        peak = magnitude.max(axis=0)
+        greater = peak > self.peak
+        self.peak[greater] = peak[greater]
+        self.peak_time[greater] = times[k[greater]]
+    def summary(self):
+        count = np.where(self.count, self.count, np.nan)
+        return OrderedDict((
+            ("min", np.where(self.count, self.minimum, np.nan)),
+            ("max", np.where(self.count, self.maximum, np.nan)),
+            ("mean", self.total / count),
+            ("rms", np.sqrt(self.squares / count)),
+            ("peak_time", self.peak_time)))
+
+def statistics(source, times, progress=None, chunk_size=CHUNK_SIZE):
+    header, data = load_sidecar(source)
+    if data is None:
+        header = {"stamp": stamp(source)}
+        blocks = parse_steps(source, header, progress, chunk_size)
+    else:
+        step = max(1, chunk_size // max(1, 8 * int(np.prod(data.shape[1:]))))
+        blocks = (np.asarray(data[start : start + step]) for start in range(0, len(data), step))
+    stats, row = None, 0
+    for block in blocks:
+        if not len(block):
+            continue
+        if stats is None:
+            stats = Statistics(block.shape[1:])
+        block_times = np.full(len(block), np.nan)
+        block_times[:len(times[row : row + len(block)])] = times[row : row + len(block)]
+        stats.update(block, block_times)
+        row += len(block)
+    if stats is None:
+        return header.get("labels", list()), dict()
+    return header["labels"], stats.summary()
+
+def netcdf_statistics(netcdf, ext, chunk_size=CHUNK_SIZE):
+    labels = netcdf.labels(ext)
+    step = max(1, chunk_size // max(1, 8 * sum(netcdf.widths(ext, labels))))
+    stats = None
+    for start in range(0, len(netcdf.times), step):
+        labels, block = netcdf.read(ext, slice(start, start + step))
+        if stats is None:
+            stats = Statistics(block.shape[1:])
+        stats.update(block, netcdf.times[start : start + step])
+    return labels, stats.summary() if stats else dict()
+
+def run_arrays(base, ext, netcdf=False):
+    if netcdf:
+        netcdf = NetCDF(".".join((base, "nc")))
+        return netcdf.times, NetCDFStore(netcdf, ext)
+    times = read_out(".".join((base, "out")))[1][::output_frequency(".".join((base, "log")))]
+    return times, LabelStore(".".join((base, ext)))
+
+def compare(first, second):
+    times, store = first
+    other_times, other = second
+    labels = [label for label in store.labels() if label in other]
+    differences = list()
+    for label in labels:
+        values, other_values = store[label], other[label]
+        n, m = min(len(times), len(values)), min(len(other_times), len(other_values))
+        width = min(values.shape[1], other_values.shape[1])
+        rows = np.flatnonzero((other_times[0] <= times[:n]) & (times[:n] <= other_times[m - 1])) if m else np.empty(0, dtype=int)
+        if not len(rows) or not width:
+            differences.append((np.full(width, np.nan), np.full(width, np.nan)))
+            continue
+        t = times[rows]
+        k = np.clip(np.searchsorted(other_times[:m], t, side='right') - 1, 0, max(m - 2, 0))
+        span = other_times[np.minimum(k + 1, m - 1)] - other_times[k]
+        w = np.where(0. < span, (t - other_times[k]) / np.where(0. < span, span, 1.), 0.)[:, None]
+        interpolated = other_values[k, :width] * (1. - w) + other_values[np.minimum(k + 1, m - 1), :width] * w
+        difference = np.abs(np.asarray(values[rows, :width]) - interpolated)
+        valid = ~np.isnan(difference)
+        count = valid.sum(axis=0)
+        difference = np.where(valid, difference, 0.)
+        differences.append((np.where(count, difference.max(axis=0), np.nan), np.sqrt((difference * difference).sum(axis=0) / np.where(count, count, np.nan))))
+    n_fields = max([len(maximum) for maximum, rms in differences] + [0])
+    maximum, rms = np.full((len(labels), n_fields), np.nan), np.full((len(labels), n_fields), np.nan)
+    for i, (label_max, label_rms) in enumerate(differences):
+        maximum[i, :len(label_max)], rms[i, :len(label_rms)] = label_max, label_rms
+    return labels, {"max": maximum, "rms": rms}
+
+class LabelStore:
+    def __init__(self, source, progress=None):
+        self.header, self.values = cached(source, parse_columns, progress, name=".cols")
+        self.table = OrderedDict(zip(self.header["labels"], self.header["table"]))
+    def __contains__(self, label):
+        return label in self.table
+    def __getitem__(self, label):
+        offset, count, width = self.table[label]
+        return self.values[offset : offset + count * width].reshape(count, width)
+    def labels(self):
+        return list(self.table.keys())
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+class LabelIndex:
+    def __init__(self, source):
+        self.source = source
+        self.header, self.index = cached(source, parse_line_index, name=".lines")
+        self.columns = OrderedDict((label, i) for i, label in enumerate(self.header["labels"]))
+    def __contains__(self, label):
+        return label in self.columns
+    def __getitem__(self, label):
+        i = self.columns[label]
+        starts = self.index[:, i].astype(np.int64)
+        if i + 1 < self.index.shape[1]:
+            ends = self.index[:, i + 1].astype(np.int64)
+        else:
+            ends = np.append(self.index[1:, 0], self.header["end"]).astype(np.int64)
+        width = self.header["widths"][i]
+        if not len(starts):
+            return np.empty((0, width - 1))
+        rows = list()
+        with open(self.source, 'rb') as f:
+            for start, end in zip(starts, ends):
+                f.seek(start)
+                rows.append(f.read(end - start))
+        return np.fromstring(b"".join(rows), sep=" ").reshape(len(starts), width)[:, 1:]
+    def labels(self):
+        return list(self.columns.keys())
+    @property
+    def nbytes(self):
+        return self.index.nbytes
+
+class StepIndex:
+    def __init__(self, base, ext="mov", frequency=1):
+        self.source = ".".join((base, ext))
+        header, out_index = cached(".".join((base, "out")), parse_out_index, name=".idx")
+        header, index = cached(self.source, parse_step_index, name=".idx")
+        self.layout = StepLayout(header["labels"], header["widths"])
+        out_index = out_index[::frequency]
+        n = min(len(out_index), len(index))
+        self.steps = out_index[:n, 0].astype(int)
+        self.times = np.array(out_index[:n, 1])
+        self.out_offsets = out_index[:n, 2].astype(np.int64)
+        self.offsets = np.append(index[:n, 0].astype(np.int64), index[n, 0] if n < len(index) else header["end"])
+    def __len__(self):
+        return len(self.times)
+    def find(self, time):
+        return min(max(int(np.searchsorted(self.times, time, side='right')) - 1, 0), len(self) - 1)
+    def read(self, k, count=1):
+        k, end = max(k, 0), min(k + count, len(self))
+        if end <= k:
+            return np.empty((0, len(self.layout.labels), self.layout.n_fields))
+        with open(self.source, 'rb') as f:
+            f.seek(self.offsets[k])
+            buf = f.read(self.offsets[end] - self.offsets[k])
+        return self.layout.unpack(np.fromstring(buf, sep=" "))[0]
+
+def last_lines(source, n=10, size=1 << 14):
+    try:
+        with open(source, 'rb') as f:
+            f.seek(max(0, f.seek(0, 2) - size))
+            return f.read().decode(errors='replace').splitlines()[-n:]
+    except OSError:
+        return list()
+
+def link_or_copy(source, destination):
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+def sweep_variants(values, grid=True):
+    names, columns = list(), list()
+    for item in values.split(";"):
+        if item.strip():
+            name, equals, choices = item.partition("=")
+            if not equals:
+                raise ValueError("Expected name = value, value, ... in " + repr(item.strip()))
+            names.append(name.strip())
+            columns.append([choice.strip() for choice in choices.split(",") if choice.strip()])
+    if not grid and len(set(len(column) for column in columns)) > 1:
+        raise ValueError("Each Set card needs the same number of values unless sweeping a grid")
+    return names, [list(variant) for variant in (product(*columns) if grid else zip(*columns))] if names else list()
+
+class ResultCache:
+    def __init__(self, root, budget):
+        self.root, self.budget = root, budget
+    def key(self, input_file, command, executable=None):
+        digest = hashlib.sha256()
+        digest.update("\0".join(command[:-1]).encode())
+        if executable and os.path.exists(executable):
+            digest.update(json.dumps(stamp(executable)).encode())
+        pending, seen = [input_file], set()
+        while pending:
+            source = os.path.abspath(pending.pop())
+            if source in seen:
+                continue
+            seen.add(source)
+            with open(source, 'rb') as f:
+                content = f.read()
+            digest.update(hashlib.sha256(content).digest())
+            for name in re.findall(rb'"([^"\n]+)"', content):
+                path = os.path.join(os.path.dirname(source), name.decode(errors='replace'))
+                if os.path.isfile(path):
+                    pending.append(path)
+        return digest.hexdigest()
+    def fetch(self, key, base):
+        entry = os.path.join(self.root, key)
+        if not os.path.exists(os.path.join(entry, "complete")):
+            return None
+        for ext in RESULT_EXTS:
+            if os.path.exists(".".join((base, ext))):
+                os.remove(".".join((base, ext)))
+        for name in os.listdir(entry):
+            if name.startswith("run."):
+                link_or_copy(os.path.join(entry, name), ".".join((base, os.path.splitext(name)[1][1:])))
+        try:
+            with open(os.path.join(entry, "solver.json"), 'r') as f:
+                solver = json.load(f)
+        except (OSError, ValueError):
+            solver = dict()
+        os.utime(entry)
+        return solver
+    def store(self, key, base, solver=None):
+        entry = os.path.join(self.root, key)
+        if os.path.exists(entry):
+            shutil.rmtree(entry)
+        os.makedirs(entry)
+        for ext in RESULT_EXTS:
+            if os.path.exists(".".join((base, ext))):
+                link_or_copy(".".join((base, ext)), os.path.join(entry, "run." + ext))
+        with open(os.path.join(entry, "solver.json"), 'w') as f:
+            json.dump(solver or dict(), f)
+        open(os.path.join(entry, "complete"), 'w').close()
+        self.evict(keep=key)
+    def evict(self, keep=None):
+        entries = list()
+        for key in os.listdir(self.root):
+            entry = os.path.join(self.root, key)
+            if os.path.isdir(entry):
+                entries.append((os.path.getmtime(entry), sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry)), key))
+        size = sum(entry[1] for entry in entries)
+        for mtime, entry_size, key in sorted(entries):
+            if size <= self.budget:
+                break
+            if key != keep:
+                shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+                size -= entry_size
+
+class Tail:
+    def __init__(self, source):
+        self.source = source
+        self.file = None
+        self.buffer = b""
+    def read(self):
+        if self.file is not None:
+            try:
+                st = os.stat(self.source)
+            except OSError:
+                return b""
+            if st.st_ino != os.fstat(self.file.fileno()).st_ino or st.st_size < self.file.tell():
+                self.close()
+                self.reset()
+        if self.file is None:
+            try:
+                self.file = open(self.source, 'rb')
+            except OSError:
+                return b""
+        self.buffer += self.file.read()
+        end = self.buffer.rfind(b"\n") + 1
+        text, self.buffer = self.buffer[:end], self.buffer[end:]
+        return text
+    def reset(self):
+        self.buffer = b""
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+class StepTail(Tail):
+    def __init__(self, source):
+        super().__init__(source)
+        self.reset()
+    def reset(self):
+        super().reset()
+        self.layout = None
+        self.text = b""
+        self.leftover = np.empty(0)
+    def read(self, final=False):
+        self.text += super().read()
+        if self.layout is None:
+            labels, widths, complete = scan_layout(self.text.splitlines())
+            if not (complete or (final and labels)):
+                return np.empty((0, 0, 0))
+            self.layout = StepLayout(labels, widths)
+        text, self.text = self.text, b""
+        block, self.leftover = self.layout.unpack(np.concatenate((self.leftover, np.fromstring(text, sep=" "))))
+        return block
+
+class OutTail(Tail):
+    def latest(self):
+        text = super().read()
+        start = text.rfind(b"\nStep ") + 1
+        if not (start or text.startswith(b"Step ")):
+            return None
+        fields = text[start:].split(None, 3)
+        return float(fields[2]) if 2 < len(fields) else None
+    def read(self):
+        steps, times = list(), list()
+        for line in super().read().splitlines():
+            if line.startswith(b"Step"):
+                fields = line.split()
+                steps.append(int(fields[1]))
+                times.append(float(fields[2]))
+        return np.array(steps, dtype=int), np.array(times, dtype=float)
+
+class NetCDF:
+    def __init__(self, nc_file):
+        from scipy.io import netcdf_file
+        self.file = netcdf_file(nc_file, 'r', mmap=True)
+        self.times = np.array(self.file.variables["time"].data, dtype=float)
+        self.groups = dict()
+        for name, variable in self.file.variables.items():
+            parts = name.split(".")
+            if len(parts) == 4 and parts[2].isdigit():
+                self.groups.setdefault(".".join(parts[:2]), dict()).setdefault(int(parts[2]), OrderedDict())[parts[3]] = variable
+    def fields(self, ext, label):
+        variables = self.groups.get(NETCDF_GROUPS.get(ext), dict()).get(label, OrderedDict())
+        names = list()
+        for name in NETCDF_FIELDS.get(ext, variables.keys()):
+            for choice in ((name,) if isinstance(name, str) else name):
+                if choice in variables:
+                    names.append(choice)
+                    break
+        return [variables[name].data.reshape(len(variables[name].data), -1) for name in names]
+    def labels(self, ext):
+        return [label for label in sorted(self.groups.get(NETCDF_GROUPS.get(ext), dict())) if self.fields(ext, label)]
+    def close(self):
+        self.groups = dict()
+        self.file.close()
+    def widths(self, ext, labels):
+        return [1 + sum(field.shape[1] for field in self.fields(ext, label)) for label in labels]
+    def read(self, ext, select=None):
+        rows = slice(None)
+        if isinstance(select, slice):
+            rows = select
+        elif select is not None:
+            rows = np.zeros(len(self.times), dtype=bool)
+            rows[:len(select)] = select[:len(self.times)]
+        labels = self.labels(ext)
+        n_fields = max(self.widths(ext, labels)) - 1 if labels else 0
+        data = np.full((len(self.times[rows]), len(labels), n_fields), np.nan)
+        for i, label in enumerate(labels):
+            columns = 0
+            for field in self.fields(ext, label):
+                data[:, i, columns : columns + field.shape[1]] = field[rows]
+                columns += field.shape[1]
+        return labels, data
+
+class NetCDFStore:
+    def __init__(self, netcdf, ext):
+        self.netcdf, self.ext = netcdf, ext
+    def __contains__(self, label):
+        return bool(self.netcdf.fields(self.ext, label))
+    def __getitem__(self, label):
+        fields = self.netcdf.fields(self.ext, label)
+        if not fields:
+            raise KeyError(label)
+        return np.column_stack(fields).astype(float)
+    def labels(self):
+        return self.netcdf.labels(self.ext)
+
+class NetCDFIndex(StepIndex):
+    def __init__(self, base, ext="mov"):
+        self.ext = ext
+        self.netcdf = NetCDF(".".join((base, "nc")))
+        self.times = self.netcdf.times
+        labels = self.netcdf.labels(ext)
+        self.layout = StepLayout(labels, self.netcdf.widths(ext, labels))
+    def read(self, k, count=1):
+        return self.netcdf.read(self.ext, slice(max(k, 0), k + count))[1]
+    def close(self):
+        self.netcdf.close()
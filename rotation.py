@@ -0,0 +1,77 @@
+# --------------------------------------------------------------------------
+# BlenderAndMBDyn
+# Copyright (C) 2015 G. Douglas Baldwin - http://www.baldwintechnology.com
+# --------------------------------------------------------------------------
+# ***** BEGIN GPL LICENSE BLOCK *****
+#
+#    This file is part of BlenderAndMBDyn.
+#
+#    BlenderAndMBDyn is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    BlenderAndMBDyn is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with BlenderAndMBDyn.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ***** END GPL LICENCE BLOCK *****
+# -------------------------------------------------------------------------- 
+
+import numpy as np
+
+def axis_matrices(axis, angles):
+    c, s = np.cos(angles), np.sin(angles)
+    i, j = [(1, 2), (2, 0), (0, 1)][axis]
+    R = np.zeros(angles.shape + (3, 3))
+    R[..., axis, axis] = 1.
+    R[..., i, i] = R[..., j, j] = c
+    R[..., i, j] = -s
+    R[..., j, i] = s
+    return R
+
+def rotation_vector_matrices(phi):
+    theta = np.sqrt(np.sum(phi*phi, axis=-1))
+    small = theta < 1e-12
+    safe = np.where(small, 1., theta)
+    a = np.where(small, 1., np.sin(safe) / safe)
+    b = np.where(small, .5, (1. - np.cos(safe)) / (safe*safe))
+    K = np.zeros(phi.shape[:-1] + (3, 3))
+    K[..., 0, 1], K[..., 0, 2], K[..., 1, 2] = -phi[..., 2], phi[..., 1], -phi[..., 0]
+    K[..., 1, 0], K[..., 2, 0], K[..., 2, 1] = phi[..., 2], -phi[..., 1], phi[..., 0]
+    return np.eye(3) + a[..., None, None]*K + b[..., None, None]*np.matmul(K, K)
+
+def to_matrices(orientation, values):
+    values = np.asarray(values, dtype=float)
+    if orientation == "orientation matrix":
+        return values[..., :9].reshape(values.shape[:-1] + (3, 3))
+    elif orientation == "orientation vector":
+        return rotation_vector_matrices(values[..., :3])
+    angles = np.radians(values[..., :3])
+    axes = {"euler123": (0, 1, 2), "euler321": (2, 1, 0), "euler313": (2, 0, 2)}[orientation]
+    return np.matmul(np.matmul(axis_matrices(axes[0], angles[..., 0]), axis_matrices(axes[1], angles[..., 1])), axis_matrices(axes[2], angles[..., 2]))
+
+def matrices_to_euler(R):
+    cy = np.hypot(R[..., 0, 0], R[..., 1, 0])
+    gimbal = cy <= 16*np.finfo(np.float32).eps
+    euler1 = np.stack((
+        np.where(gimbal, np.arctan2(-R[..., 1, 2], R[..., 1, 1]), np.arctan2(R[..., 2, 1], R[..., 2, 2])),
+        np.arctan2(-R[..., 2, 0], cy),
+        np.where(gimbal, 0., np.arctan2(R[..., 1, 0], R[..., 0, 0]))), axis=-1)
+    euler2 = np.stack((
+        np.arctan2(-R[..., 2, 1], -R[..., 2, 2]),
+        np.arctan2(-R[..., 2, 0], -cy),
+        np.arctan2(-R[..., 1, 0], -R[..., 0, 0])), axis=-1)
+    euler2 = np.where(gimbal[..., None], euler1, euler2)
+    better = np.sum(np.abs(euler2), axis=-1) < np.sum(np.abs(euler1), axis=-1)
+    return np.where(better[..., None], euler2, euler1)
+
+def to_euler(orientation, values):
+    values = np.asarray(values, dtype=float)
+    if orientation == "euler321":
+        return np.radians(values[..., 2::-1])
+    return matrices_to_euler(to_matrices(orientation, values))
@@ -24,25 +24,30 @@
 
 if "bpy" in locals():
     import imp
-    for x in [base, menu, common, user_defined_common]:
+    for x in [base, menu, common, user_defined_common, results, rotation]:
         imp.reload(x)
 else:
     from . import base
     from . import menu
     from . import common
     from . import user_defined_common
+    from . import results
+    from . import rotation
 from .base import bpy, BPY, root_dot, database, Operator, Entity, Bundle
 from .common import FORMAT, safe_name, write_vector, write_orientation, StreamSender, StreamReceiver
 from .menu import default_klasses, simulator_tree
-from mathutils import Matrix
 import subprocess
 from tempfile import TemporaryFile
 import os
-from time import sleep
-import sys
+import shutil
+from time import time
+from threading import Thread, Lock
+from queue import Queue, Empty
 from signal import SIGTERM
-import math
-from mathutils import Vector, Euler, Quaternion
+from mathutils import Euler
+import numpy as np
+from collections import defaultdict, deque
+import json
 
 aerodynamic_types = [
     "Aerodynamic body",
@@ -105,10 +110,25 @@ class Base(Operator):
             if database.simulator and self.simulator_index < len(database.simulator):
                 exec("bpy.ops." + root_dot + "save('INVOKE_DEFAULT')")
         bpy.types.Scene.simulator_index = bpy.props.IntProperty(default=-1, update=update)
+        bpy.types.Scene.live_keyframes = bpy.props.BoolProperty(name="Live keyframes", description="Write keyframes while MBDyn is running, starting at the next frame")
+        bpy.types.Scene.live_keyframe_rate = bpy.props.IntProperty(name="Keyframes per MBDyn second", default=15, min=1)
+        bpy.types.Scene.mbdyn_output_lines = bpy.props.IntProperty(name="Output lines", description="Lines of MBDyn output to show while it runs", default=5, min=0, max=OUTPUT_LINES)
+        bpy.types.Scene.mbdyn_output_spill = bpy.props.BoolProperty(name="Save output", description="Also write all of MBDyn's output to the scene's .stdout file")
+        bpy.types.Scene.mbdyn_result_cache = bpy.props.BoolProperty(name="Reuse results", description="Serve the results of an identical earlier run (same input files, MBDyn and flags) from the result cache")
+        bpy.types.Scene.mbdyn_result_cache_size = bpy.props.IntProperty(name="Cache (MB)", description="Size of the result cache, least recently used runs are dropped first", default=4096, min=0)
+        bpy.app.handlers.load_pre.append(playback_load_pre)
     @classmethod
     def delete_list(self):
+        stop_playback()
+        bpy.app.handlers.load_pre.remove(playback_load_pre)
         del bpy.types.Scene.simulator_uilist
         del bpy.types.Scene.simulator_index
+        del bpy.types.Scene.live_keyframes
+        del bpy.types.Scene.live_keyframe_rate
+        del bpy.types.Scene.mbdyn_output_lines
+        del bpy.types.Scene.mbdyn_output_spill
+        del bpy.types.Scene.mbdyn_result_cache
+        del bpy.types.Scene.mbdyn_result_cache_size
     @classmethod
     def get_uilist(self, context):
         return context.scene.simulator_index, context.scene.simulator_uilist
@@ -121,8 +141,36 @@ class Base(Operator):
             layout.label("Choose a simulator")
         else:
             layout.operator(root_dot + "simulate")
+            row = layout.row()
+            row.prop(context.scene, "live_keyframes")
+            if context.scene.live_keyframes:
+                row.prop(context.scene, "live_keyframe_rate", text="Rate")
+            row = layout.row()
+            row.prop(context.scene, "mbdyn_output_lines")
+            row.prop(context.scene, "mbdyn_output_spill")
+            row = layout.row()
+            row.prop(context.scene, "mbdyn_result_cache")
+            if context.scene.mbdyn_result_cache:
+                row.prop(context.scene, "mbdyn_result_cache_size")
+            layout.operator(root_dot + "sweep")
+            if Sweep.jobs:
+                box = layout.box()
+                for job in Sweep.jobs:
+                    box.label(job.describe())
+            if Simulate.drain is not None and context.scene.mbdyn_output_lines:
+                box = layout.box()
+                for line in Simulate.drain.tail(context.scene.mbdyn_output_lines):
+                    box.label(line)
             if context.scene.clean_log:
                 layout.operator(root_dot + "write_keyframes")
+                layout.operator(root_dot + "playback", text="Stop playback" if Playback.index is not None else "Play back results")
+                layout.operator(root_dot + "run_summary")
+                layout.operator(root_dot + "export_results")
+                layout.operator(root_dot + "output_statistics")
+                layout.operator(root_dot + "compare_results")
+                layout.prop(context.scene, "plot_cache_budget")
+                cache = BPY.plot_data
+                layout.label("Cache: " + ", ".join((str(cache.hits) + " hits", str(cache.misses) + " misses", str(cache.evictions) + " evicted", str(cache.size >> 20) + " MB")))
 
 klasses = default_klasses(simulator_tree, Base)
 
@@ -506,15 +554,169 @@ class Save(bpy.types.Operator, Base):
         return{'FINISHED'}
 BPY.klasses.append(Save)
 
+KEYFRAME_BATCH = 256
+KEYFRAME_BATCHES = 20
+KEYFRAME_TICK = 0.05
+KEYFRAME_NODES = 64
+LIVE_INTERVAL = 1.0
+STARTUP_TIMEOUT = 600.
+LOG_TAIL = 10
+OUTPUT_LINES = 1000
+
+def fill_fcurve(action, data_path, index, frames, values, linear=False):
+    if not len(frames):
+        return
+    fcurve = action.fcurves.find(data_path, index)
+    if fcurve is None:
+        fcurve = action.fcurves.new(data_path, index, "Object Transforms")
+    points = fcurve.keyframe_points
+    co = np.empty(2*len(points), dtype=np.float32)
+    points.foreach_get("co", co)
+    co = co.reshape(-1, 2)
+    before, after = co[:, 0] < frames[0], frames[-1] < co[:, 0]
+    n, kinds = np.count_nonzero(before), list()
+    if n < len(co):
+        kinds = [kind for kind, keep in zip([point.interpolation for point in points], before | after) if keep]
+        group = fcurve.group.name if fcurve.group else "Object Transforms"
+        action.fcurves.remove(fcurve)
+        fcurve = action.fcurves.new(data_path, index, group)
+        points = fcurve.keyframe_points
+        co = np.concatenate((co[before], co[after]))
+        points.add(len(co) + len(frames))
+    else:
+        points.add(len(frames))
+    points.foreach_set("co", np.concatenate((co[:n], np.column_stack((frames, values)).astype(np.float32), co[n:])).ravel())
+    for i, kind in enumerate(kinds):
+        points[i if i < n else i + len(frames)].interpolation = kind
+    for i in range(n, n + len(frames)) if linear else ():
+        points[i].interpolation = 'LINEAR'
+    fcurve.update()
+
+def decimate(frames, channels):
+    keys = list()
+    for data_path, values, tolerance in channels:
+        for index in range(values.shape[1]):
+            keep = results.simplify(frames, values[:, index], tolerance)
+            keys.append((data_path, index, frames[keep], values[keep, index], 0. < tolerance))
+    return keys
+
+def node_action(node):
+    if node.animation_data is None:
+        node.animation_data_create()
+    if node.animation_data.action is None:
+        node.animation_data.action = bpy.data.actions.new(node.name + "Action")
+    return node.animation_data.action
+
+def insert_keyframes(node, keys):
+    action = node_action(node)
+    for data_path, index, frames, values, linear in keys:
+        fill_fcurve(action, data_path, index, frames, values, linear)
+
+class LiveKeyframes:
+    def __init__(self, base, orientation, rate, frame):
+        self.base, self.orientation, self.dt, self.frame = base, orientation, 1.0 / rate, frame
+        self.mov, self.out = results.StepTail(".".join((base, "mov"))), results.OutTail(".".join((base, "out")))
+        self.times, self.pending, self.step, self.frequency = np.empty(0), None, 0, None
+        self.keytime, self.next_update = - float("inf"), 0.
+        self.fcurves = dict()
+    def fcurve(self, node, data_path, index):
+        key = (node.name, data_path, index)
+        if key not in self.fcurves:
+            action = node_action(node)
+            self.fcurves[key] = action.fcurves.find(data_path, index) or action.fcurves.new(data_path, index, "Object Transforms")
+        return self.fcurves[key]
+    def update(self, final=False):
+        if not final and time() < self.next_update:
+            return
+        self.next_update = time() + LIVE_INTERVAL
+        self.times = np.append(self.times, self.out.read()[1])
+        block = self.mov.read(final)
+        if len(block):
+            self.pending = block if self.pending is None else np.concatenate((self.pending, block))
+        if self.pending is None or not len(self.pending):
+            return
+        if self.frequency is None:
+            try:
+                self.frequency = results.output_frequency(".".join((self.base, "log")))
+            except OSError:
+                self.frequency = 1
+        times = self.times[::self.frequency][self.step : self.step + len(self.pending)]
+        fields, self.pending = self.pending[:len(times)], self.pending[len(times):]
+        self.step += len(times)
+        select = results.keyframe_mask(times, self.dt, self.keytime)
+        if not select.any():
+            return
+        self.keytime = times[select][-1]
+        fields = fields[select]
+        frames = self.frame + np.arange(len(fields))
+        self.frame += len(fields)
+        eulers = rotation.to_euler(self.orientation, fields[:, :, 3:])
+        for i, label in enumerate(self.mov.layout.labels):
+            node = database.node[label]
+            node.rotation_mode = 'XYZ'
+            for data_path, values in (("location", fields[:, i, :3]), ("rotation_euler", eulers[:, i])):
+                for index in range(3):
+                    points = self.fcurve(node, data_path, index).keyframe_points
+                    for frame, value in zip(frames, values[:, index]):
+                        points.insert(float(frame), float(value), {'FAST'})
+    def close(self):
+        for fcurve in self.fcurves.values():
+            fcurve.update()
+        self.mov.close()
+        self.out.close()
+
+class OutputDrain(Thread):
+    def __init__(self, stream, lines=OUTPUT_LINES, spill=None):
+        Thread.__init__(self)
+        self.daemon = True
+        self.stream = stream
+        self.lines = deque(maxlen=lines)
+        self.lock = Lock()
+        self.count = 0
+        self.spill = open(spill, 'wb') if spill else None
+    def run(self):
+        try:
+            for line in iter(self.stream.readline, b""):
+                if self.spill:
+                    self.spill.write(line)
+                with self.lock:
+                    self.lines.append(line.decode(errors='replace').rstrip())
+                    self.count += 1
+        finally:
+            if self.spill:
+                self.spill.close()
+    def tail(self, n):
+        with self.lock:
+            return list(self.lines)[-n:]
+
+def new_results(context, clean_log):
+    context.scene.clean_log = clean_log
+    context.scene.mbdyn_default_orientation = database.simulator[context.scene.simulator_index].job_control.default_orientation
+    context.scene.mbdyn_netcdf = database.simulator[context.scene.simulator_index].job_control.netcdf
+    BPY.plot_data.clear()
+    for element in database.element:
+        element.__dict__.pop("statistics", None)
+    for node in database.node:
+        if "mbdyn_statistics" in node:
+            del node["mbdyn_statistics"]
+    if "mbdyn_solver" in context.scene:
+        del context.scene["mbdyn_solver"]
+
+def result_cache(scene):
+    return results.ResultCache(bpy.utils.user_resource('DATAFILES', path="mbdyn_results", create=True), scene.mbdyn_result_cache_size << 20)
+
 class Simulate(bpy.types.Operator, Base):
     bl_idname = root_dot + "simulate"
     bl_options = {'REGISTER', 'INTERNAL'}
     bl_label = "Run simulation"
     bl_description = "Run MBDyn for the input file"
+    drain = None
     def modal(self, context, event):
         if not (event.type in ['ESC', 'TIMER'] or (hasattr(self, "channels") and event.type in self.channels)):
             return {'PASS_THROUGH'}
         if event.type == 'ESC':
+            if self.starting:
+                self.failure = "Cancelled before MBDyn wrote output"
             return self.close(context)
         #self.report({'INFO'}, self.process.stdout.read().decode())
         if hasattr(self, "sender") and event.type in self.channels:
@@ -525,16 +727,30 @@ class Simulate(bpy.types.Operator, Base):
             except BrokenPipeError:
                 return self.close(context)
         if hasattr(self, "receiver"):
-            data = self.receiver.get_data()
-            for i, node in enumerate(self.nodes):
-                node.location = Vector(data[12*i : 12*i+3])
-                node.rotation_euler = Matrix([data[12*i+3 : 12*i+6], data[12*i+6 : 12*i+9], data[12*i+9 : 12*i+12]]).to_euler(node.rotation_euler.order)
+            data = np.array(self.receiver.get_data()).reshape(-1, 12)
+            eulers = rotation.to_euler("orientation matrix", data[:, 3:])
+            for node, fields, euler in zip(self.nodes, data, eulers):
+                node.location = fields[:3]
+                node.rotation_euler = euler if node.rotation_euler.order == 'XYZ' else Euler(euler, 'XYZ').to_matrix().to_euler(node.rotation_euler.order)
+        if hasattr(self, "live"):
+            self.live.update()
+        if self.drain.count != self.drawn:
+            self.drawn = self.drain.count
+            for area in context.screen.areas:
+                if area.type == 'VIEW_3D':
+                    area.tag_redraw()
         if self.process.poll() == None:
-            if self.platform != "win32":
-                output = subprocess.check_output(("tail", "-n", "1", self.out_file))
-                if output and 2 < len(output.split()):
-                    percent = 100.*(1.-(self.t_final - float(output.split()[2]))/self.t_range)
-                    context.window_manager.progress_update(percent)
+            if self.starting:
+                if any(os.path.exists(f) for f in self.outputs):
+                    self.starting = False
+                elif STARTUP_TIMEOUT < time() - self.started:
+                    self.failure = "MBDyn wrote no output within " + str(int(STARTUP_TIMEOUT)) + " s"
+                    return self.close(context)
+                return {'PASS_THROUGH'}
+            latest = self.out.latest()
+            if latest is not None:
+                percent = 100.*(1.-(self.t_final - latest)/self.t_range)
+                context.window_manager.progress_update(percent)
             return {'PASS_THROUGH'}
         else:
             return self.close(context)
@@ -546,28 +762,47 @@ class Simulate(bpy.types.Operator, Base):
                 node.location, node.rotation_euler = preserved
             del self.nodes
         try:
-            stdout, stderr = self.process.communicate(timeout=1)
+            self.process.wait(timeout=1)
         except subprocess.TimeoutExpired:
             self.process.terminate()
-            stdout, stderr = self.process.communicate()
+            self.process.wait()
+        self.drain.join(timeout=1)
+        Simulate.drain = None
+        if self.starting and self.failure is None and not any(os.path.exists(f) for f in self.outputs):
+            self.failure = "MBDyn exited with status " + str(self.process.returncode) + " before writing output"
+        output = self.drain.tail(OUTPUT_LINES)
+        solver = results.parse_solver(output)
+        if self.cache_key is not None and self.failure is None and self.process.returncode == 0:
+            try:
+                result_cache(context.scene).store(self.cache_key, os.path.splitext(self.out_file)[0], solver)
+            except OSError as error:
+                self.report({'WARNING'}, "Results not cached: " + str(error))
         del self.process
-        if stdout:
-            self.report({'INFO'}, stdout.decode())
-        if stderr:
-            self.report({'INFO'}, stderr.decode())
+        self.out.close()
+        if output:
+            self.report({'INFO'}, "\n".join(output[-LOG_TAIL:] if self.drain.count <= LOG_TAIL else ["... " + str(self.drain.count - LOG_TAIL) + " lines before"] + output[-LOG_TAIL:]))
+        del self.drain
+        if self.failure is not None:
+            self.report({'ERROR'}, "\n".join([self.failure] + results.last_lines(os.path.splitext(self.out_file)[0] + ".log", LOG_TAIL)))
         if hasattr(self, "receiver"):
             self.receiver.close()
         if hasattr(self, "sender"):
             self.sender.close()
-        context.scene.clean_log = True
-        context.scene.mbdyn_default_orientation = database.simulator[context.scene.simulator_index].job_control.default_orientation
-        BPY.plot_data.clear()
+        if hasattr(self, "live"):
+            self.live.update(final=True)
+            self.live.close()
+            del self.live
+        new_results(context, any(os.path.exists(f) for f in self.outputs))
+        context.scene["mbdyn_solver"] = solver
         wm.progress_end()
         return {'FINISHED'}
     def execute(self, context):
+        if Playback.index is not None:
+            stop_playback()
+        BPY.plot_data.clear()
         sim = database.simulator[context.scene.simulator_index]
         directory = os.path.splitext(context.blend_data.filepath)[0]
-        command = [sim.mbdyn_path if sim.mbdyn_path is not None else "mbdyn", "-s", "-f", os.path.join(directory, context.scene.name + ".mbd")]
+        command = [sim.mbdyn_path if sim.mbdyn_path is not None else "mbdyn", "-f", os.path.join(directory, context.scene.name + ".mbd")]
         self.report({'INFO'}, " ".join(command))
         animation = database.element.filter("Stream animation")
         events = database.driver.filter("Event stream")
@@ -576,7 +811,33 @@ class Simulate(bpy.types.Operator, Base):
             self.values = [d.initial_value for d in drives]
             self.channels = {d.increment : (i, 1) for i, d in enumerate(drives)}
             self.channels.update({d.decrement : (i, -1) for i, d in enumerate(drives)})
-        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        base = os.path.join(directory, context.scene.name)
+        self.cache_key = None
+        if context.scene.mbdyn_result_cache and not (animation or events or drives or context.scene.live_keyframes):
+            cache = result_cache(context.scene)
+            self.cache_key = cache.key(command[-1], command, shutil.which(command[0]))
+            solver = cache.fetch(self.cache_key, base)
+            if solver is not None:
+                self.report({'INFO'}, "Results of an identical run served from the cache")
+                new_results(context, True)
+                context.scene["mbdyn_solver"] = solver
+                return{'FINISHED'}
+        self.out_file = ".".join((base, "out"))
+        self.outputs = [self.out_file, ".".join((base, "nc"))]
+        for ext in results.RESULT_EXTS:
+            if os.path.exists(".".join((base, ext))):
+                os.remove(".".join((base, ext)))
+        self.starting, self.started, self.failure = True, time(), None
+        try:
+            self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        except OSError as error:
+            self.report({'ERROR'}, str(error))
+            new_results(context, False)
+            return{'CANCELLED'}
+        self.drain = OutputDrain(self.process.stdout, spill=os.path.join(directory, context.scene.name + ".stdout") if context.scene.mbdyn_output_spill else None)
+        self.drain.start()
+        self.drawn = 0
+        Simulate.drain = self.drain
         if events:
             host_name, port_number = events[0].host_name, events[0].port_number
             self.sender = StreamSender(host_name=host_name, port_number=port_number)
@@ -595,102 +856,490 @@ class Simulate(bpy.types.Operator, Base):
             else:
                 self.report({'INFO'}, "Animation stream socket failed to connect")
                 del self.receiver
-        self.out_file = os.path.join(directory, context.scene.name + ".out")
+        self.out = results.OutTail(self.out_file)
+        if context.scene.live_keyframes:
+            self.live = LiveKeyframes(os.path.join(directory, context.scene.name), sim.job_control.default_orientation,
+                context.scene.live_keyframe_rate, context.scene.frame_current + 1)
         self.t_final = sim.final_time if sim.final_time is not None else float("inf")
         self.t_range = self.t_final - (sim.initial_time if sim.initial_time is not None else 0.0)
-        while not os.path.exists(self.out_file):
-            sleep(0.5)
         wm = context.window_manager
         wm.progress_begin(0., 100.)
         self.timer = wm.event_timer_add(1./24., context.window)
         wm.modal_handler_add(self)
-        self.platform = sys.platform
         return{'RUNNING_MODAL'}
 BPY.klasses.append(Simulate)
 
-class FileWrapper:
-    def __init__(self, file):
-        self.file = file
-        self.pos = 0
-        self.size = self.file.seek(0, 2)
-        self.file.seek(0, 0)
-    def __next__(self):
-        line = next(self.file)
-        self.pos += len(line)
-        return line
-    def __iter__(self):
-        line = next(self.file)
-        while line:
-            self.pos += len(line)
-            yield line
-            line = next(self.file)
+class SweepJob:
+    def __init__(self, directory, command, values):
+        self.directory, self.command, self.values = directory, command, values
+        self.process, self.out, self.fraction, self.status, self.elapsed = None, None, 0., None, None
+    def start(self, base):
+        self.started, self.stdout = time(), None
+        try:
+            self.stdout = open(os.path.join(self.directory, base + ".stdout"), 'wb')
+            self.process = subprocess.Popen(self.command, stdout=self.stdout, stderr=subprocess.STDOUT, cwd=self.directory)
+        except OSError as error:
+            self.status, self.elapsed = str(error), time() - self.started
+            if self.stdout is not None:
+                self.stdout.close()
+            return
+        self.out = results.OutTail(os.path.join(self.directory, base + ".out"))
+    def poll(self, t_initial, t_final):
+        latest = self.out.latest()
+        if latest is not None and t_initial < t_final < float("inf"):
+            self.fraction = min(max((latest - t_initial) / (t_final - t_initial), 0.), 1.)
+        if self.process.poll() is not None:
+            self.finish()
+    def finish(self):
+        self.status, self.elapsed = self.process.returncode, time() - self.started
+        self.fraction = 1. if self.status == 0 else self.fraction
+        self.out.close()
+        self.stdout.close()
+        self.process = None
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.finish()
+    def describe(self):
+        if self.status == 0:
+            state = "done"
+        elif self.status is not None:
+            state = "failed (" + str(self.status) + ")"
+        elif self.process is None:
+            state = "waiting"
+        else:
+            state = str(int(100. * self.fraction)) + "%"
+        return os.path.basename(self.directory) + ": " + ", ".join(self.values) + " - " + state
+
+class Sweep(bpy.types.Operator, Base):
+    bl_idname = root_dot + "sweep"
+    bl_options = {'REGISTER', 'INTERNAL'}
+    bl_label = "Parametric sweep"
+    bl_description = "Run MBDyn once for each combination of Set card values, several runs at a time (ESC to stop)"
+    values = bpy.props.StringProperty(name="Values", description="Set card values to sweep, as name = value, value, ...; name = value, ...")
+    grid = bpy.props.BoolProperty(name="Grid", description="Run every combination of the values rather than pairing them in order", default=True)
+    workers = bpy.props.IntProperty(name="Concurrent runs", default=max(1, (os.cpu_count() or 2) // 2), min=1)
+    jobs = list()
+    @classmethod
+    def poll(cls, context):
+        return not context.scene.dirty_simulator and database.input_card.filter("Set") and not Sweep.jobs
+    def invoke(self, context, event):
+        if not self.values:
+            self.values = "; ".join(card.name + " = " + card.value for card in database.input_card.filter("Set"))
+        return context.window_manager.invoke_props_dialog(self, width=500)
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            for job in Sweep.jobs:
+                job.stop()
+            return self.close(context)
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+        running = 0
+        for job in Sweep.jobs:
+            if job.process is not None:
+                job.poll(self.t_initial, self.t_final)
+            if job.process is not None:
+                running += 1
+        for job in Sweep.jobs:
+            if running < self.workers and job.process is None and job.status is None:
+                job.start(context.scene.name)
+                if job.process is not None:
+                    running += 1
+        context.window_manager.progress_update(sum(job.fraction for job in Sweep.jobs))
+        for area in context.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+        if not running:
+            return self.close(context)
+        return {'PASS_THROUGH'}
+    def close(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer)
+        wm.progress_end()
+        summary = {"names": self.names, "runs": [{"directory": job.directory, "values": job.values, "status": job.status, "elapsed": job.elapsed} for job in Sweep.jobs]}
+        with open(os.path.join(self.directory, "sweep.json"), 'w') as f:
+            json.dump(summary, f, indent=1)
+        failed = [job for job in Sweep.jobs if job.status != 0]
+        self.report({'ERROR'} if failed else {'INFO'}, str(len(Sweep.jobs) - len(failed)) + " of " + str(len(Sweep.jobs)) + " runs finished in " + self.directory +
+            ("".join("\n" + job.describe() for job in failed) if failed else ""))
+        Sweep.jobs = list()
+        return{'FINISHED'}
+    def execute(self, context):
+        try:
+            self.names, variants = results.sweep_variants(self.values, self.grid)
+        except ValueError as error:
+            self.report({'ERROR'}, str(error))
+            return{'CANCELLED'}
+        if database.element.filter("Stream animation") or database.driver.filter("Event stream") or database.drive.filter("Event drive"):
+            self.report({'ERROR'}, "Cannot sweep a model with stream animation elements, event stream drivers or event drives, its runs would share one socket")
+            return{'CANCELLED'}
+        cards = dict((card.name, card) for card in database.input_card.filter("Set"))
+        missing = [name for name in self.names if name not in cards]
+        if missing or not variants:
+            self.report({'ERROR'}, "No Set card named " + ", ".join(missing) if missing else "No values to sweep")
+            return{'CANCELLED'}
+        sim = database.simulator[context.scene.simulator_index]
+        self.directory = os.path.join(os.path.splitext(context.blend_data.filepath)[0], context.scene.name + "_sweep")
+        preserve = [(cards[name], cards[name].value) for name in self.names]
+        jobs = list()
+        try:
+            for k, variant in enumerate(variants):
+                directory = os.path.join(self.directory, str(k))
+                os.makedirs(directory, exist_ok=True)
+                for name, value in zip(self.names, variant):
+                    cards[name].value = value
+                sim.write_input_file(context, directory)
+                command = [sim.mbdyn_path if sim.mbdyn_path is not None else "mbdyn", "-f", os.path.join(directory, context.scene.name + ".mbd")]
+                jobs.append(SweepJob(directory, command, [name + "=" + value for name, value in zip(self.names, variant)]))
+        finally:
+            for card, value in preserve:
+                card.value = value
+        Sweep.jobs = jobs
+        self.t_initial = sim.initial_time if sim.initial_time is not None else 0.0
+        self.t_final = sim.final_time if sim.final_time is not None else float("inf")
+        wm = context.window_manager
+        wm.progress_begin(0., float(len(jobs)))
+        self.timer = wm.event_timer_add(1./4., context.window)
+        wm.modal_handler_add(self)
+        return{'RUNNING_MODAL'}
+    def draw(self, context):
+        layout = self.layout
+        layout.prop(self, "values")
+        row = layout.row()
+        row.prop(self, "grid")
+        row.prop(self, "workers")
+BPY.klasses.append(Sweep)
+
+class KeyframeParser(Thread):
+    def __init__(self, base, orientation, rate, bulk, netcdf, tolerances):
+        Thread.__init__(self)
+        self.daemon = True
+        self.base, self.orientation, self.rate, self.bulk, self.netcdf = base, orientation, rate, bulk, netcdf
+        self.tolerances = tolerances
+        self.batches = Queue()
+        self.parsing = True
+        self.parsed, self.keyframe_count, self.labels = 0., 0, list()
+    def progress(self, fraction):
+        if not self.parsing:
+            raise results.Cancelled
+        self.parsed = fraction
+    def run(self):
+        try:
+            if self.netcdf:
+                netcdf = results.NetCDF(".".join((self.base, "nc")))
+                self.labels, data = netcdf.read("mov", results.keyframe_mask(netcdf.times, 1.0 / self.rate))
+                self.parsed = 1.
+            else:
+                steps, times = results.read_out(".".join((self.base, "out")))
+                times = times[::results.output_frequency(".".join((self.base, "log")))]
+                select = results.keyframe_mask(times, 1.0 / self.rate)
+                self.labels, data = results.read_steps(".".join((self.base, "mov")), select, self.progress)
+            self.keyframe_count = len(data)
+            size = max(KEYFRAME_BATCH, -(-len(data) // KEYFRAME_BATCHES)) if self.bulk else 1
+            for start in range(0, len(data), size):
+                if not self.parsing:
+                    break
+                fields = data[start : start + size]
+                locations, eulers = fields[:, :, :3], rotation.to_euler(self.orientation, fields[:, :, 3:])
+                if self.bulk:
+                    frames = start + np.arange(len(fields))
+                    for i in range(len(self.labels)):
+                        if not self.parsing:
+                            break
+                        self.batches.put((start, len(fields), i, decimate(frames, [
+                            ("location", locations[:, i], self.tolerances[0]),
+                            ("rotation_euler", eulers[:, i], self.tolerances[1])])))
+                else:
+                    for i in range(0, len(self.labels), KEYFRAME_NODES):
+                        self.batches.put((start, 1, i, (locations[0, i : i + KEYFRAME_NODES], eulers[0, i : i + KEYFRAME_NODES])))
+        except results.Cancelled:
+            pass
+        except Exception as e:
+            self.batches.put(e)
+        self.batches.put(None)
     def close(self):
-        self.file.close()
-    def seek(self, *args, **kwargs):
-        self.file.seek(*args, **kwargs)
+        self.parsing = False
 
 class WriteKeyframes(bpy.types.Operator, Base):
     bl_idname = root_dot + "write_keyframes"
     bl_options = {'REGISTER', 'INTERNAL'}
     bl_label = "Write keyframes"
-    bl_description = "Import each node's location and orientation into Blender keyframes starting at the next frame"
+    bl_description = "Import each node's location and orientation into Blender keyframes starting at the next frame (ESC to stop)"
     steps = bpy.props.IntProperty(name="MBDyn steps between Blender keyframes", default=1, min=1)
     rate = bpy.props.IntProperty(name="Keyframes per MBDyn second", default=15, min=1)
+    bulk = bpy.props.BoolProperty(name="Bulk insertion", description="Fill each node's F-curves in a few bulk calls instead of one keyframe at a time", default=True)
+    location_tolerance = bpy.props.FloatProperty(name="Location tolerance", description="Drop location keyframes that change the curve by less than this and interpolate the rest linearly, 0 to keep them all", default=0., min=0., precision=6, unit='LENGTH')
+    rotation_tolerance = bpy.props.FloatProperty(name="Rotation tolerance", description="Drop rotation keyframes that change the curve by less than this and interpolate the rest linearly, 0 to keep them all", default=0., min=0., precision=6, unit='ROTATION')
     def invoke(self, context, event):
         return context.window_manager.invoke_props_dialog(self)
-    def insert_keyframe(self, label, fields):
-        database.node[label].location = fields[:3]
-        if self.orientation == "orientation matrix":
-            euler = Matrix([fields[3:6], fields[6:9], fields[9:12]]).to_euler()
-            database.node[label].rotation_euler = euler[0], euler[1], euler[2]
-        elif self.orientation == "euler321":
-            database.node[label].rotation_euler = Euler((math.radians(fields[5]), math.radians(fields[4]), math.radians(fields[3])), 'XYZ')
-        elif self.orientation == "euler123":
-            database.node[label].rotation_euler = Euler((math.radians(fields[3]), math.radians(fields[4]), math.radians(fields[5])), 'ZYX').to_quaternion().to_euler('XYZ')
-            #database.node[label].rotation_mode = 'ZYX'
-        elif self.orientation == "orientation vector":
-            #database.node[label].rotation_axis_angle = [math.sqrt(sum([x*x for x in fields[3:6]]))] + fields[3:6]
-            database.node[label].rotation_euler = Quaternion(fields[3:6], math.sqrt(sum([x*x for x in fields[3:6]]))).to_euler('XYZ')
+    def insert_keyframe(self, label, location, euler):
+        database.node[label].location = location
+        database.node[label].rotation_euler = euler
         for data_path in "location rotation_euler".split():
             database.node[label].keyframe_insert(data_path)
-    def execute(self, context):
-        self.orientation = database.simulator[context.scene.simulator_index].job_control.default_orientation
-        if self.orientation == "euler313":
-            self.report({'ERROR'}, "euler313 cannot be imported. Simulate in another format, selected from Job Control -> Default Orientation")
-        scene = context.scene
-        frame_initial = scene.frame_current
+    def apply(self, context, start, count, i, keys):
+        labels = self.parser.labels
+        if self.bulk:
+            frame = self.frame_initial + 1 + start
+            insert_keyframes(database.node[labels[i]], [(data_path, index, frame + frames, values, linear) for data_path, index, frames, values, linear in keys])
+            self.applied += count
+        else:
+            context.scene.frame_current = self.frame_initial + 1 + start
+            locations, eulers = keys
+            for label, location, euler in zip(labels[i:], locations, eulers):
+                self.insert_keyframe(label, location, euler)
+            self.applied += len(locations)
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self.report({'INFO'}, "Keyframe import cancelled after " + str(self.applied // max(len(self.parser.labels), 1)) + " keyframes")
+            return self.close(context)
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+        deadline = time() + KEYFRAME_TICK
+        while time() < deadline:
+            try:
+                batch = self.parser.batches.get_nowait()
+            except Empty:
+                break
+            if batch is None:
+                return self.close(context)
+            if isinstance(batch, Exception):
+                self.report({'ERROR'}, str(batch))
+                continue
+            self.apply(context, *batch)
+        if self.parser.keyframe_count:
+            context.window_manager.progress_update(50. + 50. * self.applied / (self.parser.keyframe_count * max(len(self.parser.labels), 1)))
+        else:
+            context.window_manager.progress_update(50. * self.parser.parsed)
+        return {'PASS_THROUGH'}
+    def close(self, context):
         wm = context.window_manager
-        wm.progress_begin(0., 100.)
-        directory = os.path.splitext(context.blend_data.filepath)[0]
-        dt = 1.0 / self.rate
-        keytime = - float("inf")
-        parser = lambda l: (int(l[0]), [float(x) for x in l[1:]])
-        with open(os.path.join(directory, scene.name + ".out")) as f_out, open(os.path.join(directory, scene.name + ".mov")) as f_mov:
-            label, fields = parser(f_mov.readline().split())
-            fw_out = FileWrapper(f_out)
-            for step, time in map(lambda l: (int(l[1]), float(l[2])), map(str.split, filter(lambda ln: ln.startswith("Step"), fw_out))):
-                is_a_keyframe = dt < time - keytime
-                if is_a_keyframe:
-                    keytime = time
-                    scene.frame_current += 1
-                    wm.progress_update(100. * float(fw_out.pos) / float(fw_out.size))
-                labels = list()
-                while f_mov and label not in labels:
-                    if is_a_keyframe:
-                        self.insert_keyframe(label, fields)
-                    labels.append(label)
-                    split_line = f_mov.readline().split()
-                    if split_line:
-                        label, fields = parser(split_line)
+        wm.event_timer_remove(self.timer)
+        self.parser.close()
+        del self.parser
         for node in database.node:
             node.rotation_mode = 'XYZ'
-        scene.frame_current = frame_initial + 1
+        context.scene.frame_current = self.frame_initial + 1
         wm.progress_end()
         return{'FINISHED'}
+    def execute(self, context):
+        scene = context.scene
+        self.frame_initial = scene.frame_current
+        self.applied = 0
+        base = os.path.join(os.path.splitext(context.blend_data.filepath)[0], scene.name)
+        orientation = database.simulator[context.scene.simulator_index].job_control.default_orientation
+        self.parser = KeyframeParser(base, orientation, self.rate, self.bulk, scene.mbdyn_netcdf, (self.location_tolerance, self.rotation_tolerance))
+        self.parser.start()
+        wm = context.window_manager
+        wm.progress_begin(0., 100.)
+        self.timer = wm.event_timer_add(1./24., context.window)
+        wm.modal_handler_add(self)
+        return{'RUNNING_MODAL'}
     def draw(self, context):
         layout = self.layout
         #layout.label("File has " + str(int(self.N/(self.i+1))) + " timesteps.")
         layout.prop(self, "rate")
+        layout.prop(self, "bulk")
+        if self.bulk:
+            layout.prop(self, "location_tolerance")
+            layout.prop(self, "rotation_tolerance")
 BPY.klasses.append(WriteKeyframes)
 
+def output_names(orientation):
+    names = dict()
+    for ext, fields in (("mov", results.node_fields(orientation)), ("ine", results.INE_FIELDS)):
+        names[ext] = dict((label, {"name": node.name, "fields": fields}) for label, node in enumerate(database.node))
+    for label, element in enumerate(sorted(database.element, key=lambda x: x.name)):
+        if hasattr(element, "file_ext"):
+            names.setdefault(element.file_ext, dict())[1 if element.file_ext == "grv" else label] = {"name": element.name, "type": element.type, "fields": element.labels}
+    return names
+
+class RunSummary(bpy.types.Operator, Base):
+    bl_idname = root_dot + "run_summary"
+    bl_options = {'REGISTER', 'INTERNAL'}
+    bl_label = "Run summary"
+    bl_description = "Show the solver statistics and model summary of the last run"
+    @classmethod
+    def poll(cls, context):
+        return context.scene.clean_log
+    def invoke(self, context, event):
+        base = os.path.join(os.path.splitext(context.blend_data.filepath)[0], context.scene.name)
+        try:
+            self.metadata = results.log_metadata(".".join((base, "log")))
+        except OSError as error:
+            self.report({'ERROR'}, str(error))
+            return{'CANCELLED'}
+        self.solver = dict(context.scene.get("mbdyn_solver", dict()))
+        self.steps = self.solver.get("steps")
+        if self.steps is None and os.path.exists(".".join((base, "out"))):
+            self.steps = len(results.read_out(".".join((base, "out")))[0])
+        return context.window_manager.invoke_popup(self, width=400)
+    def draw(self, context):
+        layout = self.layout
+        metadata = self.metadata
+        layout.label("Steps: " + str(self.steps) + ", output every " + str(metadata["frequency"]))
+        for kind, labels in (("Nodes", metadata["nodes"]), ("Elements", metadata["elements"])):
+            counts = defaultdict(int)
+            for name in labels.values():
+                counts[name] += 1
+            layout.label(kind + ": " + str(len(labels)) + (" (" + ", ".join(str(n) + " " + name for name, n in sorted(counts.items())) + ")" if counts else ""))
+        for name, value in sorted(self.solver.items()):
+            layout.label(name[:1].upper() + name[1:] + ": " + FORMAT(value))
+        for line in metadata["assembly"] + metadata["eigenanalysis"]:
+            layout.label(line)
+    def execute(self, context):
+        return{'FINISHED'}
+BPY.klasses.append(RunSummary)
+
+class ExportResults(bpy.types.Operator, Base):
+    bl_idname = root_dot + "export_results"
+    bl_options = {'REGISTER', 'INTERNAL'}
+    bl_label = "Export results"
+    bl_description = "Write every output file of the last run into one compressed archive of column arrays (.npz) with a manifest"
+    filepath = bpy.props.StringProperty(subtype='FILE_PATH')
+    filter_glob = bpy.props.StringProperty(default="*.npz", options={'HIDDEN'})
+    @classmethod
+    def poll(cls, context):
+        return context.scene.clean_log
+    def invoke(self, context, event):
+        self.filepath = os.path.join(os.path.splitext(context.blend_data.filepath)[0], context.scene.name) + ".npz"
+        context.window_manager.fileselect_add(self)
+        return{'RUNNING_MODAL'}
+    def execute(self, context):
+        scene = context.scene
+        base = os.path.join(os.path.splitext(context.blend_data.filepath)[0], scene.name)
+        orientation = database.simulator[scene.simulator_index].job_control.default_orientation
+        manifest = output_names(orientation)
+        manifest.update(scene=scene.name, orientation=orientation,
+            frequency=1 if scene.mbdyn_netcdf else results.output_frequency(".".join((base, "log"))))
+        wm = context.window_manager
+        wm.progress_begin(0., 1.)
+        try:
+            results.export(base, bpy.path.ensure_ext(self.filepath, ".npz"), manifest, results.NetCDF(".".join((base, "nc"))) if scene.mbdyn_netcdf else None, wm.progress_update)
+        except (OSError, ValueError) as error:
+            self.report({'ERROR'}, str(error))
+            return{'CANCELLED'}
+        finally:
+            wm.progress_end()
+        return{'FINISHED'}
+BPY.klasses.append(ExportResults)
+
+class CompareResults(bpy.types.Operator, Base):
+    bl_idname = root_dot + "compare_results"
+    bl_options = {'REGISTER', 'INTERNAL'}
+    bl_label = "Compare results"
+    bl_description = "Compare the last run with the results of this scene in another directory, interpolated onto this run's time steps"
+    directory = bpy.props.StringProperty(subtype='DIR_PATH')
+    @classmethod
+    def poll(cls, context):
+        return context.scene.clean_log
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return{'RUNNING_MODAL'}
+    def execute(self, context):
+        scene = context.scene
+        base = os.path.join(os.path.splitext(context.blend_data.filepath)[0], scene.name)
+        other = os.path.join(bpy.path.abspath(self.directory), scene.name)
+        if os.path.abspath(other) == os.path.abspath(base):
+            self.report({'ERROR'}, "Choose the results directory of another run")
+            return{'CANCELLED'}
+        netcdf = [not os.path.exists(".".join((b, "out"))) and os.path.exists(".".join((b, "nc"))) for b in (base, other)]
+        names = output_names(scene.mbdyn_default_orientation)
+        rows = list()
+        wm = context.window_manager
+        wm.progress_begin(0., float(len(results.OUTPUT_EXTS)))
+        try:
+            for n, ext in enumerate(results.OUTPUT_EXTS):
+                if not all(nc or os.path.exists(".".join((b, ext))) for b, nc in zip((base, other), netcdf)):
+                    continue
+                labels, difference = results.compare(results.run_arrays(base, ext, netcdf[0]), results.run_arrays(other, ext, netcdf[1]))
+                for i, label in enumerate(labels):
+                    entry = names.get(ext, dict()).get(label, dict())
+                    fields = entry.get("fields", list())
+                    for k in range(difference["max"].shape[1]):
+                        if not np.isnan(difference["max"][i, k]):
+                            rows.append((difference["max"][i, k], difference["rms"][i, k], ext, entry.get("name", str(label)), fields[k] if k < len(fields) else str(k + 1)))
+                wm.progress_update(n + 1)
+        except (OSError, ValueError, KeyError) as error:
+            self.report({'ERROR'}, str(error))
+            return{'CANCELLED'}
+        finally:
+            wm.progress_end()
+        rows.sort(key=lambda row: -row[0])
+        text = bpy.data.texts.get(scene.name + " comparison") or bpy.data.texts.new(scene.name + " comparison")
+        text.clear()
+        text.write("# " + base + "\n# " + other + "\n# max, rms, file, name, channel\n")
+        for row in rows:
+            text.write(", ".join([FORMAT(row[0]), FORMAT(row[1])] + list(row[2:])) + "\n")
+        if rows:
+            self.report({'INFO'}, "Largest change: " + rows[0][3] + " " + rows[0][4] + " max " + FORMAT(rows[0][0]) + ", see text " + text.name)
+        else:
+            self.report({'INFO'}, "No channels in common")
+        return{'FINISHED'}
+BPY.klasses.append(CompareResults)
+
+def playback_frame(scene):
+    index = Playback.index
+    if index is None or not len(index):
+        return
+    k = index.find(index.times[0] + float(scene.frame_current - Playback.frame_start) / Playback.rate)
+    fields = index.read(k)[0]
+    for label, node_fields, euler in zip(index.layout.labels, fields, rotation.to_euler(Playback.orientation, fields[:, 3:])):
+        node = database.node[label]
+        node.location = node_fields[:3]
+        node.rotation_euler = euler
+
+def stop_playback():
+    if playback_frame in bpy.app.handlers.frame_change_pre:
+        bpy.app.handlers.frame_change_pre.remove(playback_frame)
+    for node, location, rotation_euler in Playback.preserve:
+        node.location, node.rotation_euler = location, rotation_euler
+    Playback.preserve = list()
+    if hasattr(Playback.index, "close"):
+        Playback.index.close()
+    Playback.index = None
+
+@bpy.app.handlers.persistent
+def playback_load_pre(*args, **kwargs):
+    Playback.preserve = list()
+    stop_playback()
+
+class Playback(bpy.types.Operator, Base):
+    bl_idname = root_dot + "playback"
+    bl_options = {'REGISTER', 'INTERNAL'}
+    bl_label = "Play back results"
+    bl_description = "Pose each node from the results on every frame change, without writing keyframes (keyframed nodes override it)"
+    rate = bpy.props.IntProperty(name="Frames per MBDyn second", default=15, min=1)
+    index = None
+    preserve = list()
+    @classmethod
+    def poll(cls, context):
+        return context.scene.clean_log or Playback.index is not None
+    def invoke(self, context, event):
+        if Playback.index is not None:
+            return self.execute(context)
+        return context.window_manager.invoke_props_dialog(self)
+    def execute(self, context):
+        if Playback.index is not None:
+            stop_playback()
+            return{'FINISHED'}
+        base = os.path.join(os.path.splitext(context.blend_data.filepath)[0], context.scene.name)
+        if context.scene.mbdyn_netcdf:
+            Playback.index = results.NetCDFIndex(base, "mov")
+        else:
+            Playback.index = results.StepIndex(base, "mov", results.output_frequency(".".join((base, "log"))))
+        Playback.orientation = database.simulator[context.scene.simulator_index].job_control.default_orientation
+        Playback.frame_start = context.scene.frame_current
+        Playback.rate = self.rate
+        Playback.preserve = [(node, node.location.copy(), node.rotation_euler.copy()) for node in database.node]
+        for node in database.node:
+            node.rotation_mode = 'XYZ'
+        bpy.app.handlers.frame_change_pre.append(playback_frame)
+        playback_frame(context.scene)
+        return{'FINISHED'}
+    def draw(self, context):
+        self.layout.prop(self, "rate")
+BPY.klasses.append(Playback)
+
 bundle = Bundle(simulator_tree, Base, klasses, database.simulator)
@@ -0,0 +1,53 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import results
+
+NODES = 2000
+STEPS = 200
+
+def write_mov(path):
+    rng = np.random.RandomState(0)
+    with open(path, 'w') as f:
+        for step in range(STEPS):
+            values = rng.normal(size=(NODES, 18))
+            f.write("".join(str(label) + " " + " ".join("%.6e" % v for v in row) + "\n" for label, row in enumerate(values)))
+
+def per_line(path):
+    rows = list()
+    with open(path, 'r') as f:
+        for line in f:
+            rows.append([float(x) for x in line.split()[1:]])
+    return rows
+
+def parse(path):
+    header = {"stamp": results.stamp(path)}
+    return np.concatenate(list(results.parse_steps(path, header)))
+
+def timed(function, *args):
+    start = time.time()
+    function(*args)
+    return time.time() - start
+
+if __name__ == "__main__":
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "bench.mov")
+        write_mov(path)
+        print("file: %.1f MB, %d nodes x %d steps" % (os.path.getsize(path) / 1e6, NODES, STEPS))
+        baseline = timed(per_line, path)
+        parsed = timed(parse, path)
+        first = timed(results.read_steps, path)
+        second = timed(lambda: np.asarray(results.read_steps(path)[1]).sum())
+        print("per-line split/float:    %.2f s" % baseline)
+        print("parse_steps:             %.2f s (%.1fx)" % (parsed, baseline / parsed))
+        print("read_steps, first read:  %.2f s (writes the sidecar)" % first)
+        print("read_steps, sidecar hit: %.2f s (%.0fx)" % (second, baseline / second))
+    finally:
+        shutil.rmtree(directory)
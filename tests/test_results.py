@@ -0,0 +1,386 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import results
+import rotation
+
+LABELS = [1, 2, 10]
+STEPS = 7
+
+def step_lines(step):
+    lines = list()
+    for i, label in enumerate(LABELS):
+        values = [step + .5*i + .01*j for j in range(6 if label == 10 else 12)]
+        lines.append(" ".join([str(label)] + ["%.6e" % v for v in values]) + "\n")
+    return lines
+
+def write_run(base, steps=STEPS, truncate=None):
+    text = "".join("".join(step_lines(step)) for step in range(steps))
+    if truncate is not None:
+        text = text[:truncate]
+    with open(base + ".mov", 'w') as f:
+        f.write(text)
+    with open(base + ".out", 'w') as f:
+        f.write("# Step Time TStep\n")
+        for step in range(steps):
+            f.write("Step %d %.6e %.6e 0 0 0\n" % (step, .1*step, .1))
+    return text
+
+def scan(text):
+    starts, pos = list(), 0
+    for line in text.splitlines(True):
+        if line.endswith("\n"):
+            starts.append(pos)
+        pos += len(line)
+    return starts
+
+def parse(parse, source, chunk_size):
+    header = dict()
+    blocks = list(parse(source, header, chunk_size=chunk_size))
+    return header, np.concatenate(blocks) if blocks else np.empty((0, header["shape"][1]))
+
+class IndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.base = os.path.join(self.directory, "run")
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    def test_line_index(self):
+        starts = scan(write_run(self.base))
+        for chunk_size in (1, 7, 64, 100, 1 << 20):
+            header, index = parse(results.parse_line_index, self.base + ".mov", chunk_size)
+            self.assertEqual(index.ravel().astype(int).tolist(), starts)
+            self.assertEqual(header["end"], os.path.getsize(self.base + ".mov"))
+    def test_step_index(self):
+        starts = scan(write_run(self.base))
+        for chunk_size in (1, 7, 64, 100, 1 << 20):
+            header, index = parse(results.parse_step_index, self.base + ".mov", chunk_size)
+            self.assertEqual(index[:, 0].astype(int).tolist(), starts[::len(LABELS)])
+            self.assertEqual(header["end"], os.path.getsize(self.base + ".mov"))
+    def test_truncated_step(self):
+        text = write_run(self.base)
+        complete = len("".join("".join(step_lines(step)) for step in range(STEPS - 1)))
+        write_run(self.base, truncate=complete + len(step_lines(STEPS - 1)[0]) + 20)
+        starts = scan(text)
+        for chunk_size in (1, 7, 64, 1 << 20):
+            header, index = parse(results.parse_step_index, self.base + ".mov", chunk_size)
+            self.assertEqual(index[:, 0].astype(int).tolist(), starts[:(STEPS - 1)*len(LABELS):len(LABELS)])
+            self.assertEqual(header["end"], complete)
+            header, index = parse(results.parse_line_index, self.base + ".mov", chunk_size)
+            self.assertEqual(len(index), STEPS - 1)
+            self.assertEqual(header["end"], complete)
+        labels, data = results.read_steps(self.base + ".mov")
+        self.assertEqual(len(data), STEPS - 1)
+        self.assertEqual(len(results.StepIndex(self.base)), STEPS - 1)
+    def test_step_index_read(self):
+        write_run(self.base)
+        labels, data = results.read_steps(self.base + ".mov")
+        index = results.StepIndex(self.base)
+        self.assertEqual(list(labels), LABELS)
+        self.assertEqual(len(index), STEPS)
+        for k in range(STEPS):
+            np.testing.assert_array_equal(index.read(k), data[k:k+1])
+        np.testing.assert_array_equal(index.read(2, 3), data[2:5])
+        np.testing.assert_array_equal(index.read(STEPS - 2, 5), data[STEPS-2:])
+        self.assertEqual(len(index.read(STEPS)), 0)
+        self.assertEqual(index.find(.35), 3)
+    def test_label_index(self):
+        write_run(self.base)
+        labels, data = results.read_steps(self.base + ".mov")
+        index = results.LabelIndex(self.base + ".mov")
+        for i, label in enumerate(LABELS):
+            np.testing.assert_array_equal(index[label], data[:, i, :index.header["widths"][i] - 1])
+    def test_label_store(self):
+        write_run(self.base)
+        labels, data = results.read_steps(self.base + ".mov")
+        self.assertIsInstance(results.label_store(self.base + ".mov"), results.LabelIndex)
+        store = results.LabelStore(self.base + ".mov")
+        self.assertIsInstance(results.label_store(self.base + ".mov"), results.LabelStore)
+        self.assertEqual(store.labels(), LABELS)
+        for i, label in enumerate(LABELS):
+            np.testing.assert_array_equal(store[label], data[:, i, :store.header["widths"][i] - 1])
+
+class LogTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log = os.path.join(self.directory, "run.log")
+        with open(self.log, 'w') as f:
+            f.write("MBDyn 1.7.3\n"
+                "structural node: 1 0 0 0 1 0 0 0 1 0 0 0 1\n"
+                "structural node: 2 1 0 0 1 0 0 0 1 0 0 0 1\n"
+                "revolute hinge: 3 1 0 0 0 2 0 0 0\n"
+                "total joint: 4 1 0 0 0 2 0 0 0\n"
+                "initial time: 0\n"
+                "output frequency: 5\n")
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    def test_log_metadata(self):
+        metadata = results.log_metadata(self.log)
+        self.assertEqual(metadata["frequency"], 5)
+        self.assertEqual(metadata["nodes"], {"1": "structural node", "2": "structural node"})
+        self.assertEqual(metadata["elements"], {"3": "revolute hinge", "4": "total joint"})
+        self.assertEqual(sorted(os.listdir(self.directory)), ["run.log", "run.log.meta.json"])
+        self.assertEqual(results.log_metadata(self.log), metadata)
+    def test_parse_solver(self):
+        solver = results.parse_solver(["End of simulation at time 1 after 1000 steps;", "output in directory \"/tmp\"",
+            "total iterations: 2000", "total Jacobian matrices: 1000", "total error: 1.5e-10"])
+        self.assertEqual(solver, {"final time": 1., "steps": 1000, "iterations": 2000., "Jacobian matrices": 1000., "error": 1.5e-10})
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, "run.mov")
+        with open(self.source, 'w') as f:
+            f.write("1 0\n")
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    def test_eviction(self):
+        cache = results.Cache(budget=3*800)
+        for key in "abc":
+            cache.get(key, self.source, lambda: np.zeros(100))
+        cache.get("a", self.source, lambda: self.fail("a should be cached"))
+        cache.get("d", self.source, lambda: np.zeros(100))
+        self.assertEqual(list(cache.entries), ["c", "a", "d"])
+        self.assertEqual((cache.hits, cache.misses, cache.evictions, cache.size), (1, 4, 1, 3*800))
+        cache.resize(800)
+        self.assertEqual(list(cache.entries), ["d"])
+        cache.get("e", self.source, lambda: np.zeros(1000))
+        self.assertEqual(list(cache.entries), ["e"])
+    def test_stamp(self):
+        cache = results.Cache()
+        loads = list()
+        load = lambda: loads.append(1) or np.zeros(len(loads))
+        cache.get("a", self.source, load)
+        cache.get("a", self.source, load)
+        self.assertEqual(len(loads), 1)
+        with open(self.source, 'a') as f:
+            f.write("1 1\n")
+        cache.get("a", self.source, load)
+        self.assertEqual(len(loads), 2)
+        self.assertEqual(cache.size, 16)
+        cache.get("b", os.path.join(self.directory, "missing"), load)
+        cache.get("b", os.path.join(self.directory, "missing"), load)
+        self.assertEqual(len(loads), 3)
+    def test_clear(self):
+        closed = list()
+        class Closing:
+            nbytes = 8
+            def close(self):
+                closed.append(self)
+        cache = results.Cache()
+        cache.get("a", self.source, Closing)
+        cache.get("b", self.source, lambda: np.zeros(1))
+        cache.clear()
+        self.assertEqual((len(cache), cache.size, len(closed)), (0, 0, 1))
+
+class MinMaxTest(unittest.TestCase):
+    def test_short(self):
+        self.assertEqual(results.min_max(np.arange(10.), 5).tolist(), list(range(10)))
+    def test_buckets(self):
+        y = np.random.RandomState(0).normal(size=1003)
+        keep = results.min_max(y, 10)
+        self.assertTrue((np.diff(keep) > 0).all())
+        self.assertLessEqual(len(keep), 2*10 + 2)
+        self.assertEqual((keep[0], keep[-1]), (0, len(y) - 1))
+        size = -(-len(y) // 10)
+        for start in range(0, len(y), size):
+            bucket = keep[(start <= keep) & (keep < start + size)]
+            self.assertEqual(y[bucket].min(), y[start : start + size].min())
+            self.assertEqual(y[bucket].max(), y[start : start + size].max())
+
+class SimplifyTest(unittest.TestCase):
+    def check(self, x, y, tolerance):
+        keep = results.simplify(x, y, tolerance)
+        self.assertTrue(keep[0] and keep[-1])
+        self.assertLessEqual(np.abs(np.interp(x, x[keep], y[keep]) - y).max(), tolerance)
+        return keep
+    def test_zero_tolerance(self):
+        y = np.random.RandomState(0).normal(size=50)
+        self.assertTrue(results.simplify(np.arange(50.), y, 0.).all())
+    def test_line(self):
+        x = np.arange(100.)
+        self.assertEqual(np.flatnonzero(self.check(x, 3.*x + 1., 1e-9)).tolist(), [0, 99])
+    def test_ramp_and_stop(self):
+        x = np.arange(100.)
+        self.assertEqual(np.flatnonzero(self.check(x, np.minimum(x, 40.), 1e-3)).tolist(), [0, 40, 99])
+    def test_noise(self):
+        x = np.linspace(0., 10., 2000)
+        y = np.sin(x) + .001*np.random.RandomState(0).normal(size=len(x))
+        keep = self.check(x, y, .01)
+        self.assertLess(np.count_nonzero(keep), len(x) // 10)
+
+class SpectralTest(unittest.TestCase):
+    def setUp(self):
+        self.fs = 100.
+        self.values = np.random.RandomState(0).normal(size=(1000, 2))
+    def test_welch(self):
+        from scipy import signal
+        frequencies, power = results.welch(self.values, self.fs, 128, .5)
+        reference_frequencies, reference = signal.welch(self.values, self.fs, window='hann', nperseg=128, noverlap=64, axis=0)
+        np.testing.assert_array_equal(frequencies, reference_frequencies)
+        np.testing.assert_allclose(power, reference, rtol=0., atol=1e-15)
+    def test_spectrogram(self):
+        from scipy import signal
+        frequencies, times, power = results.spectrogram(self.values, self.fs, 128, .5)
+        reference_frequencies, reference_times, reference = signal.spectrogram(self.values, self.fs, window='hann', nperseg=128, noverlap=64, axis=0)
+        np.testing.assert_array_equal(frequencies, reference_frequencies)
+        np.testing.assert_allclose(times, reference_times)
+        np.testing.assert_allclose(power, reference, rtol=0., atol=1e-15)
+    def test_spectrum(self):
+        t = np.arange(1000) / self.fs
+        frequencies, amplitude = results.spectrum((3.*np.sin(2.*np.pi*10.*t) + 5.)[:, None], self.fs)
+        self.assertEqual(frequencies[np.argmax(amplitude[:, 0])], 10.)
+        self.assertAlmostEqual(amplitude.max(), 3.)
+        self.assertAlmostEqual(amplitude[0, 0], 0.)
+    def test_uniform(self):
+        times = np.array([0., .1, .2, .35, .4, .5])
+        fs, values = results.uniform(times, np.column_stack((times, 2.*times)))
+        self.assertAlmostEqual(fs, 10.)
+        np.testing.assert_allclose(values, np.column_stack((np.arange(6) / 10., np.arange(6) / 5.)))
+
+class Store(dict):
+    def labels(self):
+        return list(self.keys())
+
+class CompareTest(unittest.TestCase):
+    def test_interpolation(self):
+        times, other_times = np.arange(11) / 10., np.arange(5) / 4.
+        ramp = lambda t: np.column_stack((t, 2.*t, np.sin(t)))
+        first = Store([(1, ramp(times)), (2, ramp(times)), (3, ramp(times))])
+        second = Store([(2, ramp(other_times)[:, :2] + [0., .5]), (1, ramp(other_times))])
+        labels, difference = results.compare((times, first), (other_times, second))
+        self.assertEqual(labels, [1, 2])
+        np.testing.assert_allclose(difference["max"][:, :2], [[0., 0.], [0., .5]], atol=1e-12)
+        np.testing.assert_allclose(difference["rms"][:, :2], [[0., 0.], [0., .5]], atol=1e-12)
+        self.assertTrue(np.isnan(difference["max"][1, 2]))
+        self.assertLess(difference["max"][0, 2], .01)
+    def test_overlap(self):
+        times, other_times = np.arange(11) / 10., .5 + np.arange(11) / 10.
+        first = Store([(1, times[:, None])])
+        second = Store([(1, other_times[:, None] + 1.)])
+        labels, difference = results.compare((times, first), (other_times, second))
+        np.testing.assert_allclose(difference["max"], [[1.]])
+        labels, difference = results.compare((times, first), (other_times + 2., second))
+        self.assertTrue(np.isnan(difference["max"]).all())
+    def test_runs(self):
+        directory = tempfile.mkdtemp()
+        try:
+            for name in ("a", "b"):
+                write_run(os.path.join(directory, name))
+                with open(os.path.join(directory, name + ".log"), 'w') as f:
+                    f.write("output frequency: 1\n")
+            labels, difference = results.compare(results.run_arrays(os.path.join(directory, "a"), "mov"), results.run_arrays(os.path.join(directory, "b"), "mov"))
+            self.assertEqual(labels, LABELS)
+            self.assertEqual(np.nanmax(difference["max"]), 0.)
+            self.assertTrue(np.isnan(difference["max"][2, 6:]).all())
+        finally:
+            shutil.rmtree(directory)
+
+class SweepTest(unittest.TestCase):
+    def test_grid(self):
+        names, variants = results.sweep_variants("k = 1, 2; c = 0.1, 0.2, 0.3;")
+        self.assertEqual(names, ["k", "c"])
+        self.assertEqual(variants, [["1", "0.1"], ["1", "0.2"], ["1", "0.3"], ["2", "0.1"], ["2", "0.2"], ["2", "0.3"]])
+    def test_paired(self):
+        names, variants = results.sweep_variants(" k=1,2 ; c=3, 4,", grid=False)
+        self.assertEqual(names, ["k", "c"])
+        self.assertEqual(variants, [["1", "3"], ["2", "4"]])
+    def test_errors(self):
+        self.assertRaises(ValueError, results.sweep_variants, "k = 1; c")
+        self.assertRaises(ValueError, results.sweep_variants, "k = 1, 2; c = 3", False)
+        self.assertEqual(results.sweep_variants(" ; "), ([], []))
+
+class ResultCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = results.ResultCache(os.path.join(self.directory, "cache"), 1 << 20)
+        os.makedirs(self.cache.root)
+        self.input = self.write("run.mbd", 'include: "model/nodes.nod";\n')
+        self.nodes = self.write("model/nodes.nod", 'include: "joints.elm";\nset: real k = 1.;\n')
+        self.joints = self.write("model/joints.elm", 'include: "nodes.nod";\n')
+        self.command = ["mbdyn", "-f", self.input]
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+    def test_key(self):
+        key = self.cache.key(self.input, self.command)
+        self.assertEqual(self.cache.key(self.input, self.command), key)
+        self.assertNotEqual(self.cache.key(self.input, ["mbdyn", "-s", "-f", self.input]), key)
+        self.write("model/joints.elm", 'include: "nodes.nod";\n# changed\n')
+        changed = self.cache.key(self.input, self.command)
+        self.assertNotEqual(changed, key)
+        self.write("model/nodes.nod", 'include: "joints.elm";\nset: real k = 2.;\n')
+        self.assertNotEqual(self.cache.key(self.input, self.command), changed)
+    def test_store_fetch(self):
+        key = self.cache.key(self.input, self.command)
+        base = os.path.join(self.directory, "run")
+        self.assertIsNone(self.cache.fetch(key, base))
+        for ext in ("out", "log", "mov"):
+            self.write("run." + ext, ext + "\n")
+        self.cache.store(key, base, {"steps": 10})
+        for ext in ("out", "log", "mov"):
+            os.remove(base + "." + ext)
+        self.write("run.jnt", "stale\n")
+        self.assertEqual(self.cache.fetch(key, base), {"steps": 10})
+        for ext in ("out", "log", "mov"):
+            with open(base + "." + ext) as f:
+                self.assertEqual(f.read(), ext + "\n")
+        self.assertFalse(os.path.exists(base + ".jnt"))
+        self.assertFalse(os.path.exists(base + ".json"))
+    def test_evict(self):
+        base = os.path.join(self.directory, "run")
+        self.write("run.out", "x" * 600)
+        self.cache.budget = 1000
+        self.cache.store("a", base)
+        os.utime(os.path.join(self.cache.root, "a"), (0, 0))
+        self.cache.store("b", base)
+        self.assertEqual(os.listdir(self.cache.root), ["b"])
+
+def xyz_matrices(euler):
+    return np.matmul(np.matmul(rotation.axis_matrices(2, euler[:, 2]), rotation.axis_matrices(1, euler[:, 1])), rotation.axis_matrices(0, euler[:, 0]))
+
+class RotationTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.angles = np.degrees(np.column_stack((rng.uniform(-np.pi, np.pi, 50), rng.uniform(-1.5, 1.5, 50), rng.uniform(-np.pi, np.pi, 50))))
+        self.matrices = xyz_matrices(np.radians(self.angles))
+    def check(self, orientation, values, matrices):
+        np.testing.assert_allclose(xyz_matrices(rotation.to_euler(orientation, values)), matrices, atol=1e-9)
+    def test_orientation_matrix(self):
+        self.check("orientation matrix", self.matrices.reshape(-1, 9), self.matrices)
+    def test_orientation_vector(self):
+        R = self.matrices
+        theta = np.arccos(np.clip((np.trace(R, axis1=1, axis2=2) - 1.)/2., -1., 1.))
+        axis = np.column_stack((R[:, 2, 1] - R[:, 1, 2], R[:, 0, 2] - R[:, 2, 0], R[:, 1, 0] - R[:, 0, 1]))
+        phi = axis * (theta/(2.*np.sin(theta)))[:, None]
+        np.testing.assert_allclose(rotation.to_matrices("orientation vector", phi), R, atol=1e-9)
+        self.check("orientation vector", phi, R)
+    def test_euler123(self):
+        R = rotation.to_matrices("euler123", self.angles)
+        a = np.radians(self.angles)
+        np.testing.assert_allclose(R, np.matmul(np.matmul(rotation.axis_matrices(0, a[:, 0]), rotation.axis_matrices(1, a[:, 1])), rotation.axis_matrices(2, a[:, 2])), atol=1e-12)
+        self.check("euler123", self.angles, R)
+    def test_euler321(self):
+        R = rotation.to_matrices("euler321", self.angles[:, ::-1])
+        np.testing.assert_allclose(R, self.matrices, atol=1e-9)
+        self.check("euler321", self.angles[:, ::-1], self.matrices)
+    def test_euler313(self):
+        self.check("euler313", self.angles, rotation.to_matrices("euler313", self.angles))
+    def test_gimbal_lock(self):
+        angles = np.array([[30., 90., 0.], [0., -90., 45.]])
+        self.check("euler123", angles, rotation.to_matrices("euler123", angles))
+
+if __name__ == "__main__":
+    unittest.main()